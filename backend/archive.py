@@ -0,0 +1,280 @@
+"""Bulk ingestion of a ZIP of documents.
+
+Entries are streamed out of the archive one at a time, straight into the
+upload dir; nothing else in the archive is written to disk. Up to
+ARCHIVE_WORKERS files are in flight at once: extraction, chunking and dedup
+run in a pool of ARCHIVE_PROCESSES processes (0 keeps them on threads) and
+embedding runs on threads against the in-process model. Firestore metadata
+is written in batches of ARCHIVE_WRITE_BATCH, and question pools are queued
+once a file's metadata is committed.
+
+`ingest_archive` is an async generator of plain-dict events, streamed as
+NDJSON by the route:
+
+- `{"event": "skipped", "name", "reason"}` an entry that was not ingested
+- `{"event": "file", "name", "file_id", "filename", "chunks", "dedup", ...}`
+  a file that was stored, indexed and committed
+- `{"event": "error", "name", "error"}` a file that failed
+- `{"event": "done", "uploaded", "skipped", "failed", "elapsed_ms"}`
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import shutil
+import time
+import uuid
+import zipfile
+from concurrent.futures import Executor, ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Set, Tuple
+
+from db import get_db
+from models import FileMeta
+from pool import schedule_fill
+from rag import build_or_load_vectorstore, load_chunks
+from storage import record_write, remove_derived
+
+logger = logging.getLogger(__name__)
+
+
+ARCHIVE_WORKERS = int(os.getenv("ARCHIVE_WORKERS", str(os.cpu_count() or 4)))
+ARCHIVE_PROCESSES = int(os.getenv("ARCHIVE_PROCESSES", str(os.cpu_count() or 4)))
+ARCHIVE_WRITE_BATCH = min(500, int(os.getenv("ARCHIVE_WRITE_BATCH", "25")))  # Firestore caps a batch at 500 writes
+ARCHIVE_MAX_FILES = int(os.getenv("ARCHIVE_MAX_FILES", "500"))
+COPY_BUFFER = 1024 * 1024
+
+_process_pool: ProcessPoolExecutor | None = None
+
+
+def _plan(zf: zipfile.ZipFile, allowed_exts: Set[str], max_bytes: int) -> Tuple[List[zipfile.ZipInfo], List[Tuple[str, str]]]:
+	"""Split archive entries into those to ingest and (name, reason) pairs to skip"""
+	accepted, skipped = [], []
+	for info in zf.infolist():
+		name = info.filename
+		base = os.path.basename(name.rstrip("/"))
+		if info.is_dir():
+			continue
+		if name.startswith("__MACOSX/") or base.startswith("."):
+			skipped.append((name, "hidden or metadata file"))
+			continue
+		ext = (base.rsplit(".", 1)[-1] if "." in base else "").lower()
+		if ext not in allowed_exts:
+			skipped.append((name, f"unsupported file type: {ext or 'none'}"))
+		elif info.flag_bits & 0x1:
+			skipped.append((name, "encrypted entry"))
+		elif info.file_size > max_bytes:
+			skipped.append((name, f"exceeds {max_bytes // (1024 * 1024)}MB limit"))
+		elif len(accepted) >= ARCHIVE_MAX_FILES:
+			skipped.append((name, f"archive holds more than {ARCHIVE_MAX_FILES} files"))
+		else:
+			accepted.append(info)
+	return accepted, skipped
+
+
+def _reserve_path(upload_dir: str, filename: str, reserved: Set[str]) -> str:
+	"""Final path for an entry, unique among existing uploads and this archive's other entries"""
+	path = os.path.join(upload_dir, filename)
+	if os.path.exists(path) or path in reserved:
+		stem, ext = os.path.splitext(filename)
+		path = os.path.join(upload_dir, f"{stem}_{uuid.uuid4()}{ext}")
+	reserved.add(path)
+	return path
+
+
+def _save_entry(zf: zipfile.ZipFile, info: zipfile.ZipInfo, final_path: str, max_bytes: int) -> int:
+	"""Stream one entry from the archive to `final_path`; returns the bytes written"""
+	file_ext = final_path.rsplit(".", 1)[-1].lower()
+	tmp_path = os.path.join(os.path.dirname(final_path), f"tmp_{uuid.uuid4()}.{file_ext}")
+	written = 0
+	try:
+		with zf.open(info) as src, open(tmp_path, "wb") as out:
+			while True:
+				data = src.read(COPY_BUFFER)
+				if not data:
+					break
+				written += len(data)
+				# The header's size can lie; count what actually comes out
+				if written > max_bytes:
+					raise ValueError(f"Exceeds {max_bytes // (1024 * 1024)}MB limit")
+				out.write(data)
+		shutil.move(tmp_path, final_path)
+	finally:
+		if os.path.exists(tmp_path):
+			os.remove(tmp_path)
+	return written
+
+
+def _extract_executor() -> Executor | None:
+	"""Process pool for extraction/chunking, which is mostly pure Python and holds the GIL"""
+	global _process_pool
+	if ARCHIVE_PROCESSES <= 0:
+		return None
+	if _process_pool is None:
+		# spawn, not fork: the server process has live threads (uvicorn, executors, torch)
+		_process_pool = ProcessPoolExecutor(max_workers=ARCHIVE_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+	return _process_pool
+
+
+def shutdown_workers() -> None:
+	global _process_pool
+	if _process_pool is not None:
+		_process_pool.shutdown(wait=False, cancel_futures=True)
+		_process_pool = None
+
+
+class _Stopped(Exception):
+	"""The archive request went away; the entry was abandoned between steps"""
+
+
+async def _process_entry(zf: zipfile.ZipFile, info: zipfile.ZipInfo, final_path: str, user_id: str, max_bytes: int, stopping: asyncio.Event) -> dict:
+	written = await asyncio.to_thread(_save_entry, zf, info, final_path, max_bytes)
+	file_id = str(uuid.uuid4())
+	try:
+		if stopping.is_set():
+			raise _Stopped()
+		chunks, dedup = await asyncio.get_running_loop().run_in_executor(_extract_executor(), load_chunks, final_path)
+		if stopping.is_set():
+			raise _Stopped()
+		if chunks:
+			# Embedding stays in-process (one model copy); torch releases the GIL while it runs
+			await asyncio.to_thread(build_or_load_vectorstore, file_id, chunks, dedup)
+	except Exception:
+		os.remove(final_path)
+		# A failed embed or write can leave part of the index behind
+		await asyncio.to_thread(remove_derived, file_id)
+		raise
+
+	meta = FileMeta(
+		user_id=user_id,
+		filename=os.path.basename(final_path),
+		filepath=final_path,
+		filetype=final_path.rsplit(".", 1)[-1].lower(),
+		upload_date=datetime.now(timezone.utc),
+	).model_dump()
+	meta["file_id"] = file_id
+	return {"meta": meta, "bytes": written, "chunks": len(chunks), "dedup": dedup}
+
+
+def _commit(results: List[Tuple[str, dict]]) -> None:
+	db = get_db()
+	batch = db.batch()
+	for _, result in results:
+		meta = result["meta"]
+		batch.set(db.collection("files").document(meta["file_id"]), meta)
+	batch.commit()
+
+
+def _discard(result: dict) -> None:
+	meta = result["meta"]
+	remove_derived(meta["file_id"])
+	if os.path.exists(meta["filepath"]):
+		os.remove(meta["filepath"])
+
+
+async def _flush(pending: List[Tuple[str, dict]], committed: Set[str]) -> AsyncIterator[dict]:
+	"""Commit the pending files' metadata in one batch, add their ids to `committed` and report them"""
+	try:
+		await asyncio.to_thread(_commit, pending)
+		committed.update(result["meta"]["file_id"] for _, result in pending)
+	except Exception as e:
+		logger.error(f"Archive metadata batch of {len(pending)} failed: {e}")
+		for name, result in pending:
+			await asyncio.to_thread(_discard, result)
+			yield {"event": "error", "name": name, "error": f"Failed to save metadata: {e}"}
+		return
+
+	prebuild = os.getenv("QUESTION_POOL_PREBUILD", "1") != "0"
+	for name, result in pending:
+		meta = result["meta"]
+		if prebuild and result["chunks"]:
+			schedule_fill(meta["file_id"], meta["filepath"])
+		yield {
+			"event": "file",
+			"name": name,
+			"file_id": meta["file_id"],
+			"filename": meta["filename"],
+			"filetype": meta["filetype"],
+			"upload_date": meta["upload_date"].isoformat(),
+			"bytes": result["bytes"],
+			"chunks": result["chunks"],
+			"dedup": result["dedup"],
+		}
+
+
+async def ingest_archive(archive_path: str, archive_name: str, user_id: str, allowed_exts: Set[str], max_bytes: int, upload_dir: str) -> AsyncIterator[dict]:
+	started = time.perf_counter()
+	counts = {"uploaded": 0, "skipped": 0, "failed": 0}
+
+	def _done() -> dict:
+		return {"event": "done", **counts, "elapsed_ms": (time.perf_counter() - started) * 1000}
+
+	try:
+		zf = zipfile.ZipFile(archive_path)
+	except zipfile.BadZipFile:
+		counts["failed"] += 1
+		yield {"event": "error", "name": archive_name, "error": "Not a valid ZIP archive"}
+		yield _done()
+		return
+
+	with zf:
+		entries, skipped = _plan(zf, allowed_exts, max_bytes)
+		for name, reason in skipped:
+			counts["skipped"] += 1
+			yield {"event": "skipped", "name": name, "reason": reason}
+
+		semaphore = asyncio.Semaphore(max(1, ARCHIVE_WORKERS))
+		reserved: Set[str] = set()
+		stopping = asyncio.Event()
+		committed: Set[str] = set()
+
+		async def _run(info: zipfile.ZipInfo, final_path: str):
+			async with semaphore:
+				if stopping.is_set():
+					return info.filename, None, _Stopped()
+				try:
+					return info.filename, await _process_entry(zf, info, final_path, user_id, max_bytes, stopping), None
+				except Exception as e:
+					return info.filename, None, e
+
+		tasks = [
+			asyncio.ensure_future(_run(info, _reserve_path(upload_dir, os.path.basename(info.filename), reserved)))
+			for info in entries
+		]
+		try:
+			pending: List[Tuple[str, dict]] = []
+			for fut in asyncio.as_completed(tasks):
+				name, result, error = await fut
+				if error is not None:
+					logger.warning(f"Archive entry {name} failed: {error}")
+					counts["failed"] += 1
+					yield {"event": "error", "name": name, "error": str(error)}
+					continue
+				record_write(result["bytes"])
+				pending.append((name, result))
+				if len(pending) >= ARCHIVE_WRITE_BATCH:
+					async for event in _flush(pending, committed):
+						counts["uploaded" if event["event"] == "file" else "failed"] += 1
+						yield event
+					pending = []
+			if pending:
+				async for event in _flush(pending, committed):
+					counts["uploaded" if event["event"] == "file" else "failed"] += 1
+					yield event
+		finally:
+			# Normally a no-op. If the client went away, entries still queued are skipped and
+			# running ones stop after their current step; their threads must finish before
+			# the archive is closed, and whatever they stored without metadata is removed.
+			stopping.set()
+			outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+			abandoned = [
+				outcome[1] for outcome in outcomes
+				if isinstance(outcome, tuple) and outcome[1] is not None and outcome[1]["meta"]["file_id"] not in committed
+			]
+			for result in abandoned:
+				await asyncio.to_thread(_discard, result)
+			if abandoned:
+				logger.warning(f"Archive request for {user_id} ended early; discarded {len(abandoned)} uncommitted files")
+
+	logger.info(f"Archive ingested for {user_id}: {counts}")
+	yield _done()
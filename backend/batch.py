@@ -0,0 +1,284 @@
+"""Batch quiz and summary generation across many files.
+
+Per-file work (metadata lookup, pool sampling, extraction, chunking) fans out
+across worker threads. Documents that still need the LLM are cut into
+sections and packed into as few prompts as the context budget allows, so an
+exam built from 20 chapters costs a handful of LLM calls instead of 20.
+
+Both runners are async generators of plain-dict events, which the routes
+either stream as NDJSON or collect into a single response:
+
+- `{"event": "file", "file_id", "filename", "source", ...}` partial result
+- `{"event": "error", "file_id", "error"}` a file that could not be processed
+- `{"event": "done", "files": [...]}` final per-file status
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+from typing import AsyncIterator, Dict, List, Tuple
+
+from db import get_file_by_id
+from rag import (
+	extract_text,
+	chunk_text,
+	generate_mcqs,
+	generate_mcqs_for_sections,
+	summarize_document,
+	summarize_documents,
+)
+from pool import sample as sample_pool, schedule_fill
+
+logger = logging.getLogger(__name__)
+
+
+BATCH_CONTEXT_CHARS = int(os.getenv("BATCH_CONTEXT_CHARS", "12000"))
+BATCH_MAX_QUESTIONS_PER_CALL = int(os.getenv("BATCH_MAX_QUESTIONS_PER_CALL", "12"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "2"))
+# Rough number of summary words one LLM response can hold (num_predict=2048)
+BATCH_SUMMARY_WORD_BUDGET = 1200
+SUMMARY_CONTEXT_CHUNKS = 10
+
+
+def _load_document(file_id: str, user_id: str) -> dict:
+	file_info = get_file_by_id(file_id, user_id)
+	if not file_info:
+		raise LookupError("File not found")
+	if not os.path.exists(file_info["filepath"]):
+		raise LookupError("File not found on disk")
+	return file_info
+
+
+def _load_chunks(file_info: dict) -> List[str]:
+	text = extract_text(file_info["filepath"])
+	chunks = chunk_text(text) if text.strip() else []
+	if not chunks:
+		raise ValueError("No text content found in file")
+	return chunks
+
+
+def _prepare_quiz(file_id: str, num_questions: int, user_id: str) -> Tuple[dict, List[dict] | None, List[str] | None]:
+	"""Metadata lookup plus either a pool sample or the document's chunks"""
+	file_info = _load_document(file_id, user_id)
+	pooled = sample_pool(file_id, num_questions)
+	if pooled is not None:
+		return file_info, pooled, None
+	schedule_fill(file_id, file_info["filepath"])
+	return file_info, None, _load_chunks(file_info)
+
+
+def _spread(chunks: List[str], budget_chars: int) -> List[str]:
+	"""Evenly spaced chunks from `chunks` that fit in `budget_chars` (at least one)"""
+	if not chunks:
+		return []
+	count = len(chunks)
+	avg = max(1, sum(len(c) for c in chunks) // count)
+	take = max(1, min(count, budget_chars // avg))
+	step = count / take
+	picked = [chunks[int(i * step)] for i in range(take)]
+	while len(picked) > 1 and sum(len(c) for c in picked) > budget_chars:
+		picked.pop()
+	if sum(len(c) for c in picked) > budget_chars:
+		picked = [picked[0][:budget_chars]]
+	return picked
+
+
+def _quiz_sections(chunks: List[str], num_questions: int) -> List[Tuple[List[str], int]]:
+	"""Split one document's request into (chunks, num_questions) sections of at most one call each"""
+	parts = max(1, math.ceil(num_questions / BATCH_MAX_QUESTIONS_PER_CALL))
+	per_part, extra = divmod(num_questions, parts)
+	slice_len = max(1, math.ceil(len(chunks) / parts))
+	sections = []
+	for part in range(parts):
+		start = (part * slice_len) % len(chunks)
+		window = chunks[start:start + slice_len]
+		n = per_part + (1 if part < extra else 0)
+		# Context grows with the number of questions asked, so small requests pack together
+		budget = max(1, BATCH_CONTEXT_CHARS * n // BATCH_MAX_QUESTIONS_PER_CALL)
+		sections.append((_spread(window, budget), n))
+	return sections
+
+
+def _pack(sections: List[dict], weight_key: str, max_weight: int) -> List[List[dict]]:
+	"""First-fit-decreasing packing by character size and a second weight limit"""
+	groups: List[List[dict]] = []
+	loads: List[Tuple[int, int]] = []
+	for section in sorted(sections, key=lambda s: s["chars"], reverse=True):
+		for i, (chars, weight) in enumerate(loads):
+			if chars + section["chars"] <= BATCH_CONTEXT_CHARS and weight + section[weight_key] <= max_weight:
+				groups[i].append(section)
+				loads[i] = (chars + section["chars"], weight + section[weight_key])
+				break
+		else:
+			groups.append([section])
+			loads.append((section["chars"], section[weight_key]))
+	return groups
+
+
+async def _run_groups(groups: List[List[dict]], call) -> AsyncIterator[Tuple[List[dict], object]]:
+	"""Run `call(group)` in worker threads with bounded concurrency, yielding as each finishes"""
+	semaphore = asyncio.Semaphore(max(1, BATCH_LLM_CONCURRENCY))
+
+	async def _guarded(group):
+		async with semaphore:
+			try:
+				return group, await asyncio.to_thread(call, group)
+			except Exception as e:
+				logger.warning(f"Batch LLM call failed: {e}")
+				return group, None
+
+	for fut in asyncio.as_completed([_guarded(g) for g in groups]):
+		yield await fut
+
+
+def _merge_items(items) -> Dict[str, int]:
+	"""Collapse repeated file_ids into one request, preserving order"""
+	wanted: Dict[str, int] = {}
+	for item in items:
+		wanted[item.file_id] = wanted.get(item.file_id, 0) + item.num_questions
+	return wanted
+
+
+def _file_event(file_id: str, status: dict, source: str, **payload) -> dict:
+	return {"event": "file", "file_id": file_id, "filename": status.get("filename"), "source": source, **payload}
+
+
+async def run_quiz_batch(items, user_id: str) -> AsyncIterator[dict]:
+	wanted = _merge_items(items)
+	statuses: Dict[str, dict] = {}
+	chunks_by_file: Dict[str, List[str]] = {}
+
+	async def _prepare(file_id):
+		try:
+			return file_id, await asyncio.to_thread(_prepare_quiz, file_id, wanted[file_id], user_id), None
+		except Exception as e:
+			return file_id, None, e
+
+	# Stage 1: metadata, pool sampling and extraction for every file in parallel
+	for fut in asyncio.as_completed([_prepare(fid) for fid in wanted]):
+		file_id, prepared, error = await fut
+		if error is not None:
+			statuses[file_id] = {"file_id": file_id, "status": "error", "error": str(error)}
+			yield {"event": "error", "file_id": file_id, "error": str(error)}
+			continue
+		file_info, pooled, chunks = prepared
+		status = {"file_id": file_id, "filename": file_info.get("filename"), "status": "ok", "num_questions": 0}
+		statuses[file_id] = status
+		if pooled is not None:
+			status["source"] = "pool"
+			status["num_questions"] = len(pooled)
+			yield _file_event(file_id, status, "pool", questions=[{**q, "file_id": file_id} for q in pooled])
+		else:
+			status["source"] = "llm"
+			chunks_by_file[file_id] = chunks
+
+	# Stage 2: pack the remaining documents into as few prompts as possible
+	sections = []
+	for file_id, chunks in chunks_by_file.items():
+		for section_chunks, n in _quiz_sections(chunks, wanted[file_id]):
+			sections.append({
+				"label": f"DOC-{len(sections) + 1}",
+				"file_id": file_id,
+				"chunks": section_chunks,
+				"num_questions": n,
+				"chars": sum(len(c) for c in section_chunks),
+			})
+	groups = _pack(sections, "num_questions", BATCH_MAX_QUESTIONS_PER_CALL)
+	if groups:
+		logger.info(f"Batch quiz: {len(sections)} sections from {len(chunks_by_file)} files packed into {len(groups)} LLM calls")
+
+	def _generate(group):
+		return generate_mcqs_for_sections([(s["label"], s["chunks"], s["num_questions"]) for s in group])
+
+	async for group, by_label in _run_groups(groups, _generate):
+		for section in group:
+			questions = (by_label or {}).get(section["label"], [])
+			if not questions:
+				continue
+			status = statuses[section["file_id"]]
+			status["num_questions"] += len(questions)
+			yield _file_event(section["file_id"], status, "llm", questions=[{**q, "file_id": section["file_id"]} for q in questions])
+
+	# Stage 3: top up files the packed prompts under-served with a dedicated call each
+	shortfall = [
+		{"file_id": fid, "chunks": _spread(chunks, BATCH_CONTEXT_CHARS), "missing": wanted[fid] - statuses[fid]["num_questions"]}
+		for fid, chunks in chunks_by_file.items()
+		if statuses[fid]["num_questions"] < wanted[fid]
+	]
+	groups = [[item] for item in shortfall]
+	async for group, questions in _run_groups(groups, lambda g: generate_mcqs(g[0]["chunks"], g[0]["missing"])):
+		file_id = group[0]["file_id"]
+		if questions:
+			status = statuses[file_id]
+			status["num_questions"] += len(questions)
+			yield _file_event(file_id, status, "llm", questions=[{**q, "file_id": file_id} for q in questions])
+
+	for file_id in chunks_by_file:
+		if statuses[file_id]["num_questions"] == 0:
+			statuses[file_id].update(status="error", error="Failed to generate quiz questions")
+			yield {"event": "error", "file_id": file_id, "error": "Failed to generate quiz questions"}
+
+	yield {"event": "done", "files": [statuses[fid] for fid in wanted]}
+
+
+async def run_summary_batch(file_ids: List[str], user_id: str, max_length: int) -> AsyncIterator[dict]:
+	file_ids = list(dict.fromkeys(file_ids))
+	statuses: Dict[str, dict] = {}
+	contexts: Dict[str, List[str]] = {}
+
+	async def _prepare(file_id):
+		try:
+			file_info = await asyncio.to_thread(_load_document, file_id, user_id)
+			return file_id, file_info, await asyncio.to_thread(_load_chunks, file_info), None
+		except Exception as e:
+			return file_id, None, None, e
+
+	for fut in asyncio.as_completed([_prepare(fid) for fid in file_ids]):
+		file_id, file_info, chunks, error = await fut
+		if error is not None:
+			statuses[file_id] = {"file_id": file_id, "status": "error", "error": str(error)}
+			yield {"event": "error", "file_id": file_id, "error": str(error)}
+			continue
+		statuses[file_id] = {"file_id": file_id, "filename": file_info.get("filename"), "status": "ok", "source": "llm"}
+		contexts[file_id] = chunks[:SUMMARY_CONTEXT_CHUNKS]
+
+	# Short documents share a prompt; long ones keep the single-document path
+	docs_per_call = max(1, min(6, BATCH_SUMMARY_WORD_BUDGET // max(1, max_length)))
+	sections = []
+	for file_id, chunks in contexts.items():
+		sections.append({
+			"label": f"DOC-{len(sections) + 1}",
+			"file_id": file_id,
+			"chunks": chunks,
+			"docs": 1,
+			"chars": sum(len(c) for c in chunks),
+		})
+	small = [s for s in sections if s["chars"] <= BATCH_CONTEXT_CHARS // 2]
+	groups = _pack(small, "docs", docs_per_call) + [[s] for s in sections if s not in small]
+
+	def _summarize(group):
+		if len(group) == 1:
+			return {group[0]["label"]: summarize_document(group[0]["chunks"], max_length)}
+		found = summarize_documents([(s["label"], s["chunks"]) for s in group], max_length)
+		for s in group:
+			if s["label"] not in found:
+				found[s["label"]] = summarize_document(s["chunks"], max_length)
+		return found
+
+	async for group, by_label in _run_groups(groups, _summarize):
+		for section in group:
+			file_id = section["file_id"]
+			summary = (by_label or {}).get(section["label"])
+			if not summary:
+				statuses[file_id].update(status="error", error="Summary generation failed")
+				yield {"event": "error", "file_id": file_id, "error": "Summary generation failed"}
+				continue
+			yield _file_event(file_id, statuses[file_id], "llm", **summary)
+
+	yield {"event": "done", "files": [statuses[fid] for fid in file_ids]}
+
+
+async def ndjson(events: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+	async for event in events:
+		yield (json.dumps(event, default=str) + "\n").encode("utf-8")
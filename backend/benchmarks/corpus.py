@@ -0,0 +1,94 @@
+"""Synthetic PDF/DOCX/PPTX corpora for the pipeline benchmarks.
+
+Documents are generated deterministically from a seed so that runs on the
+same machine are comparable against a stored baseline.
+"""
+import os
+import random
+from typing import Dict, List
+
+VOCABULARY = (
+	"data structure algorithm complexity memory cache network protocol packet "
+	"latency throughput database index query transaction isolation replica "
+	"gradient descent tensor matrix vector eigenvalue regression classifier "
+	"cloud azure compute storage container kubernetes scheduling virtual machine "
+	"blockchain ledger consensus hash signature merkle tree mining validator"
+).split()
+COURSE_CODES = ["CS101", "CS204", "DS310", "AZ-900", "MA221", "EE150"]
+
+# Pages (PDF), sections (DOCX) or slides (PPTX) per size label
+SIZES = {"small": 5, "medium": 40, "large": 160}
+
+
+def _sentence(rng: random.Random) -> str:
+	words = [rng.choice(VOCABULARY) for _ in range(rng.randint(8, 18))]
+	if rng.random() < 0.2:
+		words.insert(rng.randrange(len(words)), rng.choice(COURSE_CODES))
+	return " ".join(words).capitalize() + "."
+
+
+def _paragraph(rng: random.Random, sentences: int = 5) -> str:
+	return " ".join(_sentence(rng) for _ in range(sentences))
+
+
+def make_pdf(path: str, pages: int, seed: int = 0) -> str:
+	import fitz  # PyMuPDF
+
+	rng = random.Random(seed)
+	doc = fitz.open()
+	for number in range(pages):
+		page = doc.new_page()
+		body = "\n\n".join(_paragraph(rng) for _ in range(4))
+		page.insert_textbox(fitz.Rect(50, 50, 545, 780), f"Lecture notes - page {number + 1}\n\n{body}", fontsize=10)
+	doc.save(path)
+	doc.close()
+	return path
+
+
+def make_docx(path: str, sections: int, seed: int = 0) -> str:
+	from docx import Document
+
+	rng = random.Random(seed)
+	doc = Document()
+	for number in range(sections):
+		doc.add_heading(f"Section {number + 1}: {rng.choice(COURSE_CODES)}", level=1)
+		for _ in range(4):
+			doc.add_paragraph(_paragraph(rng))
+		table = doc.add_table(rows=3, cols=3)
+		for row in table.rows:
+			for cell in row.cells:
+				cell.text = " ".join(rng.choice(VOCABULARY) for _ in range(3))
+	doc.save(path)
+	return path
+
+
+def make_pptx(path: str, slides: int, seed: int = 0) -> str:
+	from pptx import Presentation
+
+	rng = random.Random(seed)
+	prs = Presentation()
+	layout = prs.slide_layouts[1]  # Title and content
+	for number in range(slides):
+		slide = prs.slides.add_slide(layout)
+		slide.shapes.title.text = f"Slide {number + 1}: {rng.choice(COURSE_CODES)}"
+		slide.placeholders[1].text = "\n".join(_sentence(rng) for _ in range(5))
+		slide.notes_slide.notes_text_frame.text = _paragraph(rng, 3)
+	prs.save(path)
+	return path
+
+
+MAKERS = {"pdf": make_pdf, "docx": make_docx, "pptx": make_pptx}
+
+
+def build_corpus(directory: str, sizes: List[str], filetypes: List[str], seed: int = 0) -> Dict[str, str]:
+	"""Generate (or reuse) one document per size/type; returns {"pdf-small": path, ...}"""
+	os.makedirs(directory, exist_ok=True)
+	corpus = {}
+	for size in sizes:
+		for filetype in filetypes:
+			name = f"{filetype}-{size}"
+			path = os.path.join(directory, f"{name}-s{seed}.{filetype}")
+			if not os.path.exists(path):
+				MAKERS[filetype](path, SIZES[size], seed=seed)
+			corpus[name] = path
+	return corpus
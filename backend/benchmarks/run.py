@@ -0,0 +1,254 @@
+"""Microbenchmarks for the extract -> chunk -> embed -> retrieve -> generate pipeline.
+
+Run from the backend directory:
+
+	python -m benchmarks.run                       # compare against benchmarks/baseline.json
+	python -m benchmarks.run --update-baseline     # record a new baseline
+	python -m benchmarks.run --sizes small --repeat 3 --embedder hash
+
+Each stage is timed separately over generated PDF/DOCX/PPTX documents of
+increasing size. The LLM is replaced by an in-process stub so prompt building
+and response parsing are measured without Ollama. Results (median/min wall
+time and peak traced memory per stage) are written as JSON, and the run exits
+non-zero when any stage regresses beyond the threshold against the baseline;
+flagged stages are re-measured first and only reported if they regress again.
+"""
+import argparse
+import gc
+import hashlib
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Set, Tuple
+
+import numpy as np
+
+import rag
+from benchmarks.corpus import SIZES, MAKERS, build_corpus
+
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+QUERIES = [
+	"What is the time complexity of the algorithm?",
+	"Explain transaction isolation in databases",
+	"CS204 gradient descent",
+	"How does blockchain consensus work?",
+]
+# Slowdowns below this, or below the spread between a stage's median and min, are treated as timer noise
+NOISE_FLOOR_S = 0.010
+
+
+class HashEmbedder:
+	"""Deterministic bag-of-words hashing embedder, for runs without the sentence-transformers model"""
+
+	def __init__(self, dim: int = 384):
+		self.dim = dim
+
+	def _embed(self, text: str) -> List[float]:
+		vec = np.zeros(self.dim, dtype=np.float32)
+		for token in text.lower().split():
+			digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+			vec[int.from_bytes(digest, "little") % self.dim] += 1.0
+		return vec.tolist()
+
+	def embed_documents(self, texts: List[str]) -> List[List[float]]:
+		return [self._embed(t) for t in texts]
+
+	def embed_query(self, text: str) -> List[float]:
+		return self._embed(text)
+
+
+_STUB_MCQ = {
+	"question": "Which structure does the document use for indexing?",
+	"options": ["A tree", "A list", "A queue", "A stack"],
+	"answer": "A",
+	"explanation": "The notes describe a tree index.",
+	"source_chunks": ["index query transaction"],
+}
+
+
+def stub_ollama_generate(prompt: str, model: str = None, context: List[int] | None = None) -> dict:
+	"""Instant stand-in for Ollama returning well-formed JSON for each prompt family"""
+	if '"documents"' in prompt:
+		labels = [line[4:-4] for line in prompt.splitlines() if line.startswith("=== ") and line.endswith(" ===")]
+		body = {"documents": [{"doc": l, "summary": "Stub summary.", "key_points": ["Point"], "word_count": 2} for l in labels]}
+	elif '"questions"' in prompt:
+		labels = [line[4:-4] for line in prompt.splitlines() if line.startswith("=== ") and line.endswith(" ===")]
+		body = {"questions": [{**_STUB_MCQ, "doc": l} for l in labels or [""] for _ in range(5)]}
+	elif '"summary"' in prompt:
+		body = {"summary": "Stub summary of the document.", "key_points": ["Point one", "Point two"], "word_count": 5}
+	else:
+		body = {}
+	return {"response": json.dumps(body), "context": list(range(64)), "prompt_eval_count": len(prompt) // 4, "eval_count": 32}
+
+
+def measure(fn: Callable[[], object], repeat: int) -> Dict[str, float]:
+	"""Median/min wall time over `repeat` runs plus peak traced memory from one extra run"""
+	fn()  # warm-up (imports, caches, lazy model loading)
+	times = []
+	for _ in range(repeat):
+		gc.collect()
+		start = time.perf_counter()
+		fn()
+		times.append(time.perf_counter() - start)
+	gc.collect()
+	tracemalloc.start()
+	fn()
+	_, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	return {
+		"median_s": statistics.median(times),
+		"min_s": min(times),
+		"peak_kb": peak / 1024,
+		"runs": repeat,
+	}
+
+
+def run_benchmarks(corpus: Dict[str, str], repeat: int, only: Set[str] | None = None) -> Dict[str, Dict[str, float]]:
+	"""Measure every stage for every corpus document, or just the `only` stage keys"""
+	results: Dict[str, Dict[str, float]] = {}
+
+	def record(stage: str, name: str, fn: Callable[[], object]) -> None:
+		key = f"{stage}/{name}"
+		if only is not None and key not in only:
+			return
+		results[key] = measure(fn, repeat)
+		r = results[key]
+		print(f"{key:<40} median {r['median_s'] * 1000:9.2f} ms   min {r['min_s'] * 1000:9.2f} ms   peak {r['peak_kb']:10.1f} KiB")
+
+	for name, path in corpus.items():
+		text = rag.extract_text(path)
+		chunks = rag.chunk_text(text)
+		file_id = f"bench-{name}"
+		results[f"size/{name}"] = {"chars": len(text), "chunks": len(chunks)}
+
+		record("extract_text", name, lambda: rag.extract_text(path))
+		record("chunk_text", name, lambda: rag.chunk_text(text))
+		record("embed_index", name, lambda: rag.build_or_load_vectorstore(file_id, chunks))
+
+		def _retrieve():
+			for query in QUERIES:
+				rag.retrieve_context(file_id, query, k=6)
+		record("retrieve_context", name, _retrieve)
+
+		record("summarize_prompt", name, lambda: rag.summarize_document(chunks, 500))
+		record("quiz_prompt", name, lambda: rag.generate_mcqs(chunks[:8], 5))
+		sections = [(f"DOC-{i + 1}", chunks[i:i + 2], 3) for i in range(0, min(len(chunks), 8), 2)]
+		record("batch_quiz_prompt", name, lambda: rag.generate_mcqs_for_sections(sections))
+
+	return results
+
+
+def compare(results: dict, baseline: dict, threshold: float, mem_threshold: float) -> List[Tuple[str, str]]:
+	"""(stage key, human-readable message) for each regression of `results` against `baseline`"""
+	regressions = []
+	for key, current in results["results"].items():
+		previous = baseline.get("results", {}).get(key)
+		if not previous or "min_s" not in current or "min_s" not in previous:
+			continue
+		# Both the fastest and the typical run must be slower: one noisy sample cannot fail the gate
+		noise = max(
+			NOISE_FLOOR_S,
+			previous["median_s"] - previous["min_s"],
+			current["median_s"] - current["min_s"],
+		)
+		if all(
+			current[stat] > previous[stat] * (1 + threshold) and current[stat] - previous[stat] > noise
+			for stat in ("min_s", "median_s")
+		):
+			regressions.append((
+				key,
+				f"{key}: min {current['min_s'] * 1000:.2f} ms / median {current['median_s'] * 1000:.2f} ms vs baseline "
+				f"{previous['min_s'] * 1000:.2f} / {previous['median_s'] * 1000:.2f} ms "
+				f"(+{(current['min_s'] / previous['min_s'] - 1) * 100:.0f}% min)",
+			))
+		if previous["peak_kb"] > 0 and current["peak_kb"] > previous["peak_kb"] * (1 + mem_threshold):
+			regressions.append((key, f"{key}: peak {current['peak_kb']:.0f} KiB vs baseline {previous['peak_kb']:.0f} KiB"))
+	return regressions
+
+
+def main(argv: List[str] | None = None) -> int:
+	parser = argparse.ArgumentParser(description="SmartDocs pipeline microbenchmarks")
+	parser.add_argument("--sizes", default=",".join(SIZES), help="comma-separated corpus sizes (%(default)s)")
+	parser.add_argument("--types", default=",".join(MAKERS), help="comma-separated file types (%(default)s)")
+	parser.add_argument("--repeat", type=int, default=7)
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--embedder", choices=["model", "hash"], default="hash",
+		help="deterministic hashing stub (as in the committed baseline) or the real sentence-transformers model")
+	parser.add_argument("--corpus-dir", default=os.path.join(BENCH_DIR, ".corpus"))
+	parser.add_argument("--output", default="bench_results.json")
+	parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+	parser.add_argument("--update-baseline", action="store_true")
+	parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative slowdown per stage")
+	parser.add_argument("--mem-threshold", type=float, default=0.25, help="allowed relative peak-memory growth per stage")
+	parser.add_argument("--retries", type=int, default=2,
+		help="re-measure flagged stages up to this many times; only stages that regress every time are reported")
+	args = parser.parse_args(argv)
+
+	sizes = [s for s in args.sizes.split(",") if s]
+	filetypes = [t for t in args.types.split(",") if t]
+	config = {"sizes": sizes, "types": filetypes, "seed": args.seed, "embedder": args.embedder}
+
+	# Keep benchmark indexes out of the real upload directory
+	os.environ["UPLOAD_DIR"] = tempfile.mkdtemp(prefix="smartdocs-bench-")
+	rag._ollama_generate = stub_ollama_generate
+	if args.embedder == "hash":
+		rag._embedder = HashEmbedder()
+
+	corpus = build_corpus(args.corpus_dir, sizes, filetypes, seed=args.seed)
+	results = {
+		"config": config,
+		"environment": {"python": sys.version.split()[0], "platform": platform.platform(), "machine": platform.machine()},
+		"created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+		"results": run_benchmarks(corpus, args.repeat),
+	}
+
+	with open(args.output, "w", encoding="utf-8") as f:
+		json.dump(results, f, indent=2)
+	print(f"\nResults written to {args.output}")
+
+	if args.update_baseline:
+		with open(args.baseline, "w", encoding="utf-8") as f:
+			json.dump(results, f, indent=2)
+		print(f"Baseline updated: {args.baseline}")
+		return 0
+
+	# Exit 2 (not 1, which means regressions) when there is nothing valid to compare against
+	if not os.path.exists(args.baseline):
+		print(f"No baseline at {args.baseline}; run with --update-baseline to record one")
+		return 2
+
+	with open(args.baseline, "r", encoding="utf-8") as f:
+		baseline = json.load(f)
+	if baseline.get("config") != config:
+		print(f"Skipping comparison: baseline config {baseline.get('config')} differs from this run {config}")
+		return 2
+
+	regressions = compare(results, baseline, args.threshold, args.mem_threshold)
+	# Host noise can slow down a whole stretch of a run, so only report slowdowns that reproduce
+	for _ in range(args.retries):
+		if not regressions:
+			break
+		flagged = {key for key, _ in regressions}
+		print(f"\nRe-measuring {len(flagged)} flagged stage(s): {', '.join(sorted(flagged))}")
+		results["results"].update(run_benchmarks(corpus, args.repeat, only=flagged))
+		with open(args.output, "w", encoding="utf-8") as f:
+			json.dump(results, f, indent=2)
+		regressions = compare(results, baseline, args.threshold, args.mem_threshold)
+	if regressions:
+		print("\nRegressions beyond threshold:")
+		for _, line in regressions:
+			print(f"  - {line}")
+		return 1
+	print("No regressions against baseline")
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
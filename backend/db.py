@@ -1,9 +1,16 @@
+import logging
 import os
+import time
+import uuid
 import firebase_admin
 from firebase_admin import credentials, firestore
 from typing import Optional
 from fastapi import Depends
 
+from observability import stage
+
+logger = logging.getLogger(__name__)
+
 # Global Firebase app instance
 _firebase_app: Optional[firebase_admin.App] = None
 _db: Optional[firestore.Client] = None
@@ -13,6 +20,12 @@ def initialize_firebase():
 	"""Initialize Firebase Admin SDK"""
 	global _firebase_app, _db
 	
+	if _firebase_app is None and os.getenv("DB_BACKEND", "firestore") == "memory":
+		# Explicit in-process store (load tests, offline development)
+		if not isinstance(_db, MockFirestore):
+			_db = MockFirestore()
+		return _db
+	
 	if _firebase_app is None:
 		try:
 			# Check if we have a service account key file
@@ -22,19 +35,19 @@ def initialize_firebase():
 				# Use service account file
 				cred = credentials.Certificate(service_account_path)
 				_firebase_app = firebase_admin.initialize_app(cred)
-				print(f"Firebase initialized with service account: {service_account_path}")
+				logger.info(f"Firebase initialized with service account: {service_account_path}")
 			else:
 				# Try to use default credentials (for local development)
 				_firebase_app = firebase_admin.initialize_app()
-				print("Firebase initialized with default credentials")
+				logger.info("Firebase initialized with default credentials")
 			
 			_db = firestore.client()
-			print("Firebase Firestore client created successfully")
+			logger.info("Firebase Firestore client created successfully")
 			
 		except Exception as e:
-			print(f"Warning: Firebase initialization failed: {e}")
-			print("The app will run in demo mode without database persistence")
-			print("To enable Firebase, create a service account JSON file and set FIREBASE_SERVICE_ACCOUNT_PATH")
+			logger.warning(f"Firebase initialization failed: {e}")
+			logger.warning("The app will run in demo mode without database persistence")
+			logger.warning("To enable Firebase, create a service account JSON file and set FIREBASE_SERVICE_ACCOUNT_PATH")
 			# Create a mock database for demo purposes
 			_db = MockFirestore()
 	
@@ -52,8 +65,9 @@ def get_file_by_id(file_id: str, user_id: str) -> Optional[dict]:
 	"""Get file information by file ID and user ID"""
 	try:
 		db = get_db()
-		doc_ref = db.collection("files").document(file_id)
-		doc = doc_ref.get()
+		with stage("metadata_lookup"):
+			doc_ref = db.collection("files").document(file_id)
+			doc = doc_ref.get()
 		
 		if doc.exists:
 			file_data = doc.to_dict()
@@ -63,7 +77,7 @@ def get_file_by_id(file_id: str, user_id: str) -> Optional[dict]:
 				return file_data
 		return None
 	except Exception as e:
-		print(f"Error getting file by ID: {e}")
+		logger.error(f"Error getting file by ID: {e}")
 		return None
 
 
@@ -85,39 +99,94 @@ def close_firebase():
 		firebase_admin.delete_app(_firebase_app)
 		_firebase_app = None
 		_db = None
-		print("Firebase connection closed")
+		logger.info("Firebase connection closed")
 
 
 class MockFirestore:
-	"""Mock Firestore for demo mode when Firebase credentials are not available"""
+	"""Mock Firestore for demo mode when Firebase credentials are not available.
+
+	Set `MOCK_FIRESTORE_LATENCY_MS` to add an artificial round-trip delay to
+	every read and write, e.g. to approximate real Firestore under load tests.
+	"""
 	
 	def __init__(self):
 		self.collections = {}
-		print("Mock Firestore initialized for demo mode")
+		self.latency = float(os.getenv("MOCK_FIRESTORE_LATENCY_MS", "0")) / 1000
+		logger.info("Mock Firestore initialized for demo mode")
 	
 	def collection(self, name):
 		if name not in self.collections:
-			self.collections[name] = MockCollection(name)
+			self.collections[name] = MockCollection(name, self)
 		return self.collections[name]
+	
+	def _round_trip(self):
+		if self.latency:
+			time.sleep(self.latency)
+	
+	def batch(self):
+		return MockWriteBatch(self)
+
+
+class MockWriteBatch:
+	"""Mock write batch: queued writes applied together on commit, with one round trip"""
+	
+	def __init__(self, client):
+		self.client = client
+		self.writes = []
+	
+	def set(self, reference, data):
+		self.writes.append(("set", reference, dict(data)))
+		return self
+	
+	def update(self, reference, data):
+		self.writes.append(("update", reference, dict(data)))
+		return self
+	
+	def delete(self, reference):
+		self.writes.append(("delete", reference, None))
+		return self
+	
+	def commit(self):
+		self.client._round_trip()
+		for op, reference, data in self.writes:
+			if op == "set":
+				reference.data = data
+			elif op == "update":
+				reference.data.update(data)
+			else:
+				reference.collection.documents.pop(reference.id, None)
+				reference.data = {}
+		logger.debug(f"Mock: committed batch of {len(self.writes)} writes")
+		self.writes = []
 
 
 class MockCollection:
 	"""Mock collection for demo mode"""
 	
-	def __init__(self, name):
+	def __init__(self, name, client=None):
 		self.name = name
+		self.client = client
 		self.documents = {}
 	
-	def document(self, doc_id):
+	def document(self, doc_id=None):
+		if doc_id is None:
+			doc_id = uuid.uuid4().hex
 		if doc_id not in self.documents:
 			self.documents[doc_id] = MockDocument(doc_id, self)
 		return self.documents[doc_id]
 	
 	def where(self, field, operator, value):
-		return MockQuery(self, field, operator, value)
+		return MockQuery(self).where(field, operator, value)
 	
 	def order_by(self, field, direction=None):
-		return MockQuery(self, field, "==", None, order_by=field, direction=direction)
+		return MockQuery(self).order_by(field, direction=direction)
+	
+	def stream(self):
+		return MockQuery(self).stream()
+	
+	def _round_trip(self):
+		if self.client is not None:
+			self.client._round_trip()
 
 
 class MockDocument:
@@ -129,44 +198,94 @@ class MockDocument:
 		self.data = {}
 	
 	def set(self, data):
-		self.data = data
-		print(f"Mock: Document {self.id} saved to {self.collection.name}")
+		self.collection._round_trip()
+		self.data = dict(data)
+		logger.debug(f"Mock: Document {self.id} saved to {self.collection.name}")
+	
+	def update(self, data):
+		self.collection._round_trip()
+		self.data.update(data)
+	
+	def delete(self):
+		self.collection._round_trip()
+		self.collection.documents.pop(self.id, None)
+		self.data = {}
 	
 	def get(self):
-		return MockDocumentSnapshot(self.id, self.data, self.collection.name)
+		self.collection._round_trip()
+		return MockDocumentSnapshot(self.id, self.data, self.collection.name, reference=self)
 
 
 class MockDocumentSnapshot:
 	"""Mock document snapshot for demo mode"""
 	
-	def __init__(self, doc_id, data, collection_name):
+	def __init__(self, doc_id, data, collection_name, reference=None):
 		self.id = doc_id
 		self._data = data
 		self.collection_name = collection_name
+		self.reference = reference
 	
+	@property
 	def exists(self):
 		return bool(self._data)
 	
 	def to_dict(self):
-		return self._data
+		return dict(self._data)
+
+
+_MOCK_OPERATORS = {
+	"==": lambda a, b: a == b,
+	"!=": lambda a, b: a != b,
+	"<": lambda a, b: a is not None and a < b,
+	"<=": lambda a, b: a is not None and a <= b,
+	">": lambda a, b: a is not None and a > b,
+	">=": lambda a, b: a is not None and a >= b,
+	"in": lambda a, b: a in b,
+}
 
 
 class MockQuery:
-	"""Mock query for demo mode"""
+	"""Mock query for demo mode, supporting chained where/order_by/limit"""
 	
-	def __init__(self, collection, field, operator, value, order_by=None, direction=None):
+	def __init__(self, collection):
 		self.collection = collection
-		self.field = field
-		self.operator = operator
-		self.value = value
-		self.order_by = order_by
-		self.direction = direction
+		self.filters = []
+		self.ordering = None
+		self.max_results = None
+	
+	def _copy(self):
+		query = MockQuery(self.collection)
+		query.filters = list(self.filters)
+		query.ordering = self.ordering
+		query.max_results = self.max_results
+		return query
+	
+	def where(self, field, operator, value):
+		query = self._copy()
+		query.filters.append((field, _MOCK_OPERATORS[operator], value))
+		return query
+	
+	def order_by(self, field, direction=None):
+		query = self._copy()
+		query.ordering = (field, direction == "DESCENDING")
+		return query
+	
+	def limit(self, count):
+		query = self._copy()
+		query.max_results = count
+		return query
 	
 	def stream(self):
-		# Simple mock implementation
-		docs = []
-		for doc_id, doc in self.collection.documents.items():
-			if doc.data.get(self.field) == self.value:
-				docs.append(MockDocumentSnapshot(doc_id, doc.data, self.collection.name))
-		print(f"Mock query returned {len(docs)} documents")
+		self.collection._round_trip()
+		docs = [
+			MockDocumentSnapshot(doc_id, doc.data, self.collection.name, reference=doc)
+			for doc_id, doc in list(self.collection.documents.items())
+			if doc.data and all(op(doc.data.get(field), value) for field, op, value in self.filters)
+		]
+		if self.ordering:
+			field, descending = self.ordering
+			docs.sort(key=lambda d: (d._data.get(field) is None, d._data.get(field)), reverse=descending)
+		if self.max_results is not None:
+			docs = docs[:self.max_results]
+		logger.debug(f"Mock query returned {len(docs)} documents")
 		return docs
@@ -0,0 +1,117 @@
+"""Boilerplate and near-duplicate removal for the chunk pipeline.
+
+Two passes, both deterministic so re-uploads produce the same chunks:
+
+- `strip_page_furniture` runs per page (PDF pages, PPTX slides) in
+  `extract_text`. Short lines at the top or bottom of a page that recur on at
+  least DEDUP_FURNITURE_RATIO of the pages (digits ignored, so "Page 3 of
+  40" matches "Page 4 of 40") are headers, footers or watermarks and are
+  dropped.
+- `drop_near_duplicates` runs on the chunks in `chunk_text`. Each chunk gets
+  a MinHash signature over word 3-shingles; LSH banding finds candidate pairs
+  and a chunk whose estimated Jaccard similarity to an earlier kept chunk is
+  at least DEDUP_JACCARD is dropped (repeated title slides, boilerplate
+  sections, copy-pasted pages).
+
+Both return counts of what they removed so callers can report it per document.
+The removal metric is recorded once per index build, in `rag._write_index`.
+"""
+import os
+import re
+import zlib
+from collections import Counter
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+FURNITURE_RATIO = float(os.getenv("DEDUP_FURNITURE_RATIO", "0.5"))
+FURNITURE_MIN_PAGES = 3
+FURNITURE_EDGE_LINES = 3
+FURNITURE_MAX_LEN = 100
+
+NEAR_DUP_THRESHOLD = float(os.getenv("DEDUP_JACCARD", "0.8"))
+NUM_PERM = 64
+# 16 bands of 4 rows: a pair at 0.8 Jaccard shares a band with probability 1-(1-0.8**4)**16 > 0.999
+# (8x8 would only reach 0.77); more candidates, but each is just a signature comparison
+BAND_ROWS = 4
+SHINGLE_WORDS = 3
+
+# (a * crc32 + b) mod p stays below 2**63 and wraps often enough to act as a permutation
+_PRIME = np.uint64((1 << 31) - 1)
+_rng = np.random.RandomState(20240601)
+_PERM_A = _rng.randint(1, (1 << 31) - 1, NUM_PERM).astype(np.uint64)
+_PERM_B = _rng.randint(0, (1 << 31) - 1, NUM_PERM).astype(np.uint64)
+_WORD_RE = re.compile(r"\w+")
+
+
+def _furniture_key(line: str) -> str:
+	return re.sub(r"\d+", "#", " ".join(line.lower().split()))
+
+
+def _edge_positions(lines: List[str]) -> List[int]:
+	filled = [i for i, line in enumerate(lines) if line.strip()]
+	return sorted(set(filled[:FURNITURE_EDGE_LINES] + filled[-FURNITURE_EDGE_LINES:]))
+
+
+def strip_page_furniture(pages: List[List[str]]) -> Tuple[List[List[str]], Dict[str, int]]:
+	"""Drop header/footer lines repeated across pages; pages are lists of lines"""
+	report = {"furniture_lines": 0, "furniture_chars": 0}
+	if len(pages) < FURNITURE_MIN_PAGES:
+		return pages, report
+
+	counts: Counter = Counter()
+	for lines in pages:
+		counts.update({
+			_furniture_key(lines[i]) for i in _edge_positions(lines)
+			if len(lines[i].strip()) <= FURNITURE_MAX_LEN
+		})
+	min_pages = max(FURNITURE_MIN_PAGES, FURNITURE_RATIO * len(pages))
+	furniture = {key for key, n in counts.items() if n >= min_pages}
+	if not furniture:
+		return pages, report
+
+	cleaned = []
+	for lines in pages:
+		drop = {i for i in _edge_positions(lines) if _furniture_key(lines[i]) in furniture}
+		for i in drop:
+			report["furniture_lines"] += 1
+			report["furniture_chars"] += len(lines[i])
+		cleaned.append([line for i, line in enumerate(lines) if i not in drop])
+	return cleaned, report
+
+
+def _signature(text: str) -> np.ndarray | None:
+	words = _WORD_RE.findall(text.lower())
+	if not words:
+		return None
+	if len(words) < SHINGLE_WORDS:
+		shingles = set(words)
+	else:
+		shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+	hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+	return ((np.outer(hashes, _PERM_A) + _PERM_B) % _PRIME).min(axis=0)
+
+
+def drop_near_duplicates(chunks: List[str]) -> Tuple[List[str], Dict[str, int]]:
+	"""Keep the first of every group of near-identical chunks"""
+	report = {"near_duplicate_chunks": 0, "near_duplicate_chars": 0}
+	kept: List[str] = []
+	kept_signatures: List[np.ndarray] = []
+	buckets: Dict[Tuple[int, bytes], List[int]] = {}
+	for chunk in chunks:
+		signature = _signature(chunk)
+		if signature is None:
+			kept.append(chunk)
+			continue
+		keys = [(band, signature[band:band + BAND_ROWS].tobytes()) for band in range(0, NUM_PERM, BAND_ROWS)]
+		candidates = {j for key in keys for j in buckets.get(key, ())}
+		if any(np.mean(kept_signatures[j] == signature) >= NEAR_DUP_THRESHOLD for j in candidates):
+			report["near_duplicate_chunks"] += 1
+			report["near_duplicate_chars"] += len(chunk)
+			continue
+		index = len(kept_signatures)
+		kept_signatures.append(signature)
+		for key in keys:
+			buckets.setdefault(key, []).append(index)
+		kept.append(chunk)
+	return kept, report
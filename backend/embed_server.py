@@ -0,0 +1,267 @@
+"""Shared embedding model server.
+
+Every uvicorn worker normally loads its own sentence-transformers model via
+`rag._get_embedder`, costing hundreds of MB and a slow first request per
+worker. Running this process once per host and pointing the workers at it
+with `EMBEDDINGS_SERVER` keeps a single model in memory and batches
+embedding requests from all workers together.
+
+	python embed_server.py --listen /tmp/smartdocs-embed.sock
+	EMBEDDINGS_SERVER=/tmp/smartdocs-embed.sock uvicorn main:app --workers 4
+
+`--listen` / `EMBEDDINGS_SERVER` take a Unix socket path or `tcp://host:port`.
+
+Wire format (all integers big-endian), no JSON on either side:
+
+	request:  b"SDEM" | version u8 | count u32 | blob_len u32
+	          | count x u32 byte offsets of each text end | UTF-8 blob
+	response: b"SDEM" | status u8 | rows u32 | dim u32
+	          | rows*dim little-endian float32 (status 0)
+	          | or u32 length + UTF-8 error message (status 1)
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+from typing import List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+MAGIC = b"SDEM"
+VERSION = 1
+REQUEST_HEADER = struct.Struct("!4sBII")
+RESPONSE_HEADER = struct.Struct("!4sBII")
+STATUS_OK = 0
+STATUS_ERROR = 1
+MAX_REQUEST_BYTES = 64 * 1024 * 1024
+
+
+def encode_texts(texts: List[str]) -> bytes:
+	encoded = [t.encode("utf-8") for t in texts]
+	ends = np.cumsum([len(b) for b in encoded], dtype=np.uint64) if encoded else np.zeros(0, dtype=np.uint64)
+	blob = b"".join(encoded)
+	return REQUEST_HEADER.pack(MAGIC, VERSION, len(texts), len(blob)) + ends.astype(">u4").tobytes() + blob
+
+
+def decode_texts(count: int, offsets: bytes, blob: bytes) -> List[str]:
+	ends = np.frombuffer(offsets, dtype=">u4")
+	texts, start = [], 0
+	for end in ends.tolist():
+		texts.append(blob[start:end].decode("utf-8"))
+		start = end
+	return texts
+
+
+def _parse_address(address: str) -> Tuple[str, object]:
+	if address.startswith("tcp://"):
+		host, _, port = address[len("tcp://"):].rpartition(":")
+		return "tcp", (host or "127.0.0.1", int(port))
+	return "unix", address
+
+
+class EmbeddingBatcher:
+	"""Collects concurrent requests into one model call of up to `max_batch` texts"""
+
+	def __init__(self, embedder, max_batch: int, window: float):
+		self.embedder = embedder
+		self.max_batch = max_batch
+		self.window = window
+		self.queue: asyncio.Queue = asyncio.Queue()
+
+	def _encode(self, texts: List[str]) -> np.ndarray:
+		model = getattr(self.embedder, "client", None)
+		if model is not None and hasattr(model, "encode") and not getattr(self.embedder, "multi_process", False):
+			# SentenceTransformer directly: returns one ndarray instead of nested lists. Inputs and
+			# kwargs must match HuggingFaceEmbeddings.embed_documents, or server and local vectors differ
+			texts = [t.replace("\n", " ") for t in texts]
+			kwargs = {**(getattr(self.embedder, "encode_kwargs", None) or {}), "convert_to_numpy": True}
+			return np.asarray(model.encode(texts, show_progress_bar=False, **kwargs), dtype=np.float32)
+		return np.asarray(self.embedder.embed_documents(texts), dtype=np.float32)
+
+	async def submit(self, texts: List[str]) -> np.ndarray:
+		future = asyncio.get_running_loop().create_future()
+		await self.queue.put((texts, future))
+		return await future
+
+	async def run(self) -> None:
+		loop = asyncio.get_running_loop()
+		while True:
+			batch = [await self.queue.get()]
+			total = len(batch[0][0])
+			deadline = loop.time() + self.window
+			while total < self.max_batch:
+				remaining = deadline - loop.time()
+				if remaining <= 0:
+					break
+				try:
+					item = await asyncio.wait_for(self.queue.get(), remaining)
+				except asyncio.TimeoutError:
+					break
+				batch.append(item)
+				total += len(item[0])
+
+			texts = [t for item, _ in batch for t in item]
+			try:
+				started = time.perf_counter()
+				vectors = await asyncio.to_thread(self._encode, texts) if texts else np.zeros((0, 0), np.float32)
+				logger.debug(f"Embedded {len(texts)} texts from {len(batch)} requests in {(time.perf_counter() - started) * 1000:.1f}ms")
+			except Exception as e:
+				for _, future in batch:
+					if not future.done():
+						future.set_exception(e)
+				continue
+			offset = 0
+			for item, future in batch:
+				if not future.done():
+					future.set_result(vectors[offset:offset + len(item)])
+				offset += len(item)
+
+
+async def _handle(batcher: EmbeddingBatcher, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+	try:
+		while True:
+			try:
+				header = await reader.readexactly(REQUEST_HEADER.size)
+			except asyncio.IncompleteReadError:
+				return
+			magic, version, count, blob_len = REQUEST_HEADER.unpack(header)
+			if magic != MAGIC or version != VERSION or blob_len + 4 * count > MAX_REQUEST_BYTES:
+				await _reply_error(writer, "Bad request header")
+				return
+			offsets = await reader.readexactly(4 * count)
+			blob = await reader.readexactly(blob_len)
+			try:
+				vectors = await batcher.submit(decode_texts(count, offsets, blob))
+			except Exception as e:
+				await _reply_error(writer, str(e))
+				continue
+			vectors = np.ascontiguousarray(vectors, dtype="<f4")
+			rows, dim = (vectors.shape if vectors.ndim == 2 else (0, 0))
+			writer.write(RESPONSE_HEADER.pack(MAGIC, STATUS_OK, rows, dim))
+			writer.write(memoryview(vectors).cast("B"))
+			await writer.drain()
+	finally:
+		writer.close()
+
+
+async def _reply_error(writer: asyncio.StreamWriter, message: str) -> None:
+	payload = message.encode("utf-8")
+	writer.write(RESPONSE_HEADER.pack(MAGIC, STATUS_ERROR, 0, 0) + struct.pack("!I", len(payload)) + payload)
+	await writer.drain()
+
+
+async def serve(address: str, max_batch: int, window: float) -> None:
+	from rag import get_embeddings_model
+
+	embedder = get_embeddings_model()
+	batcher = EmbeddingBatcher(embedder, max_batch, window)
+	# Load weights and warm up before accepting connections
+	batcher._encode(["warm up"])
+	# The loop only keeps a weak reference to tasks
+	batcher_task = asyncio.create_task(batcher.run())
+
+	kind, target = _parse_address(address)
+	handler = lambda r, w: _handle(batcher, r, w)
+	if kind == "unix":
+		if os.path.exists(target):
+			os.remove(target)
+		server = await asyncio.start_unix_server(handler, path=target)
+	else:
+		server = await asyncio.start_server(handler, host=target[0], port=target[1])
+	logger.info(f"Embedding server listening on {address} (max batch {max_batch}, window {window * 1000:.0f}ms)")
+	try:
+		async with server:
+			await server.serve_forever()
+	finally:
+		batcher_task.cancel()
+
+
+class EmbeddingClient:
+	"""Drop-in replacement for the LangChain embedder that talks to the embedding server.
+
+	Returns float32 ndarrays rather than nested lists; `rag` and `pool`
+	accept both. One connection is kept per thread.
+	"""
+
+	def __init__(self, address: str, timeout: float = 120.0):
+		self.address = address
+		self.timeout = timeout
+		self._local = threading.local()
+
+	def _connect(self) -> socket.socket:
+		kind, target = _parse_address(self.address)
+		sock = socket.socket(socket.AF_UNIX if kind == "unix" else socket.AF_INET, socket.SOCK_STREAM)
+		sock.settimeout(self.timeout)
+		sock.connect(target)
+		return sock
+
+	@staticmethod
+	def _recv_exact(sock: socket.socket, size: int) -> bytearray:
+		buf = bytearray(size)
+		view = memoryview(buf)
+		received = 0
+		while received < size:
+			n = sock.recv_into(view[received:])
+			if n == 0:
+				raise ConnectionError("Embedding server closed the connection")
+			received += n
+		return buf
+
+	def _request(self, texts: List[str]) -> np.ndarray:
+		sock = getattr(self._local, "sock", None)
+		for attempt in range(2):
+			try:
+				if sock is None:
+					sock = self._local.sock = self._connect()
+				sock.sendall(encode_texts(texts))
+				magic, status, rows, dim = RESPONSE_HEADER.unpack(self._recv_exact(sock, RESPONSE_HEADER.size))
+				if magic != MAGIC:
+					raise ConnectionError("Bad response from embedding server")
+				if status != STATUS_OK:
+					(length,) = struct.unpack("!I", self._recv_exact(sock, 4))
+					raise RuntimeError(f"Embedding server error: {self._recv_exact(sock, length).decode('utf-8')}")
+				data = self._recv_exact(sock, rows * dim * 4)
+				return np.frombuffer(data, dtype="<f4").reshape(rows, dim)
+			except (ConnectionError, OSError):
+				# Stale connection (server restarted); reconnect once
+				if sock is not None:
+					sock.close()
+				sock = self._local.sock = None
+				if attempt:
+					raise
+
+	def embed_documents(self, texts: List[str]) -> np.ndarray:
+		if not texts:
+			return np.zeros((0, 0), dtype=np.float32)
+		return self._request(list(texts))
+
+	def embed_query(self, text: str) -> np.ndarray:
+		return self._request([text])[0]
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="SmartDocs shared embedding server")
+	parser.add_argument("--listen", default=os.getenv("EMBEDDINGS_SERVER", "/tmp/smartdocs-embed.sock"),
+		help="Unix socket path or tcp://host:port")
+	parser.add_argument("--max-batch", type=int, default=int(os.getenv("EMBEDDINGS_SERVER_MAX_BATCH", "128")))
+	parser.add_argument("--window-ms", type=float, default=float(os.getenv("EMBEDDINGS_SERVER_WINDOW_MS", "5")),
+		help="how long to wait for more requests to join a batch")
+	args = parser.parse_args()
+
+	from dotenv import load_dotenv
+	from observability import configure_logging
+
+	load_dotenv()
+	configure_logging()
+	asyncio.run(serve(args.listen, args.max_batch, args.window_ms / 1000))
+
+
+if __name__ == "__main__":
+	main()
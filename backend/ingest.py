@@ -0,0 +1,58 @@
+"""Document (re-)ingestion: extract, chunk, index and keep the question pool in sync."""
+import logging
+from typing import List, NamedTuple, Tuple
+
+from rag import load_chunks, chunk_hash, build_or_load_vectorstore, update_vectorstore
+from pool import carry_over, load_pool, schedule_fill, windows_for
+
+logger = logging.getLogger(__name__)
+
+
+class Reindex(NamedTuple):
+	"""An indexed new version whose question pool has not been synced yet"""
+	stats: dict
+	chunks: List[str]
+	changed: List[int]
+
+
+def _load_chunks(filepath: str) -> Tuple[List[str], dict]:
+	chunks, dedup = load_chunks(filepath)
+	if not chunks:
+		raise ValueError("No text content found in file")
+	return chunks, dedup
+
+
+def reindex_document(file_id: str, source_path: str) -> Reindex:
+	"""Re-index a new version of `file_id`, embedding only new or changed chunks.
+
+	`source_path` may still be the upload's temp file: nothing here refers to
+	it afterwards, so a failure (e.g. no text) leaves the stored version and
+	its pool untouched. Call `finish_reindex` once the file is in place.
+	"""
+	chunks, dedup = _load_chunks(source_path)
+
+	previous = build_or_load_vectorstore(file_id, chunks=[])
+	old_hashes = {chunk_hash(c) for c in previous[0]} if previous else set()
+	changed = [i for i, c in enumerate(chunks) if chunk_hash(c) not in old_hashes]
+
+	stats = update_vectorstore(file_id, chunks, dedup)
+	stats["dedup"] = dedup
+	return Reindex(stats, chunks, changed)
+
+
+def finish_reindex(file_id: str, filepath: str, reindex: Reindex) -> dict:
+	"""Keep pooled questions tied to unchanged chunks and schedule generation for the changed windows"""
+	stats = dict(reindex.stats)
+	had_pool = load_pool(file_id) is not None
+	stats.update(carry_over(file_id, filepath, reindex.chunks))
+
+	if not had_pool:
+		schedule_fill(file_id, filepath)
+	elif reindex.changed:
+		schedule_fill(file_id, filepath, windows_for(reindex.changed))
+
+	logger.info(
+		f"Re-indexed {file_id}: {stats['chunks_reused']}/{stats['chunks_total']} chunks reused, "
+		f"{stats['pool_kept']} pooled questions kept, {stats['pool_dropped']} dropped"
+	)
+	return stats
@@ -0,0 +1,146 @@
+"""Compact per-document inverted index with BM25 scoring.
+
+Built next to the dense index whenever a document is chunked and stored as
+`<UPLOAD_DIR>/.index/<file_id>.lex.npz`: a sorted vocabulary plus CSR-style
+postings (chunk ids and term frequencies), so loading is a few array reads.
+
+Scoring takes corpus statistics from the caller, which lets one query be
+scored across several documents (e.g. all of a user's files) with shared IDF
+and average chunk length, as if they were a single collection.
+"""
+import math
+import os
+import re
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"\w+(?:[-./+]\w+)*")
+_STOPWORDS = frozenset(
+	"a an and are as at be by for from has have how in is it its of on or that the this to was were what when "
+	"where which who why with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+	"""Lowercased word tokens; compounds like `CS-101` or `H2O.1` also yield their parts and a joined form"""
+	tokens = []
+	for match in _TOKEN_RE.finditer(text.lower()):
+		token = match.group()
+		parts = re.split(r"[-./+]", token)
+		if len(parts) > 1:
+			tokens.append(token)
+			tokens.append("".join(parts))
+			tokens.extend(p for p in parts if p and p not in _STOPWORDS)
+		elif token not in _STOPWORDS:
+			tokens.append(token)
+	return tokens
+
+
+class LexicalIndex:
+	"""`digest` identifies the chunk list the index was built from (see `rag._chunks_digest`)"""
+
+	def __init__(self, terms: List[str], offsets: np.ndarray, chunk_ids: np.ndarray, tfs: np.ndarray, doc_len: np.ndarray, digest: str = ""):
+		self.terms = terms
+		self.offsets = offsets
+		self.chunk_ids = chunk_ids
+		self.tfs = tfs
+		self.doc_len = doc_len
+		self.digest = digest
+		self._lookup = {t: i for i, t in enumerate(terms)}
+
+	@classmethod
+	def build(cls, chunks: Iterable[str], digest: str = "") -> "LexicalIndex":
+		postings: Dict[str, List[Tuple[int, int]]] = {}
+		doc_len = []
+		for chunk_id, chunk in enumerate(chunks):
+			counts: Dict[str, int] = {}
+			tokens = tokenize(chunk)
+			for token in tokens:
+				counts[token] = counts.get(token, 0) + 1
+			doc_len.append(len(tokens))
+			for token, tf in counts.items():
+				postings.setdefault(token, []).append((chunk_id, tf))
+
+		terms = sorted(postings)
+		offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+		chunk_ids, tfs = [], []
+		for i, term in enumerate(terms):
+			for chunk_id, tf in postings[term]:
+				chunk_ids.append(chunk_id)
+				tfs.append(tf)
+			offsets[i + 1] = len(chunk_ids)
+		return cls(
+			terms,
+			offsets,
+			np.asarray(chunk_ids, dtype=np.int32),
+			np.minimum(np.asarray(tfs, dtype=np.int64), np.iinfo(np.uint16).max).astype(np.uint16),
+			np.asarray(doc_len, dtype=np.int32),
+			digest,
+		)
+
+	def save(self, path: str) -> None:
+		# Unique temp name: a search may rebuild the index while a re-index writes it
+		tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+		np.savez(
+			tmp,
+			terms=np.asarray(self.terms, dtype=np.str_),
+			offsets=self.offsets,
+			chunk_ids=self.chunk_ids,
+			tfs=self.tfs,
+			doc_len=self.doc_len,
+			digest=np.asarray(self.digest, dtype=np.str_),
+		)
+		os.replace(tmp, path)
+
+	@classmethod
+	def load(cls, path: str) -> "LexicalIndex":
+		with np.load(path, allow_pickle=False) as data:
+			digest = str(data["digest"]) if "digest" in data.files else ""
+			return cls(data["terms"].tolist(), data["offsets"], data["chunk_ids"], data["tfs"], data["doc_len"], digest)
+
+	@property
+	def num_chunks(self) -> int:
+		return len(self.doc_len)
+
+	def document_frequency(self, term: str) -> int:
+		i = self._lookup.get(term)
+		return 0 if i is None else int(self.offsets[i + 1] - self.offsets[i])
+
+	def scores(self, query_terms: List[str], idf: Dict[str, float], avg_len: float) -> np.ndarray:
+		"""BM25 score of every chunk; `idf` and `avg_len` describe the whole collection being searched"""
+		scores = np.zeros(self.num_chunks, dtype=np.float32)
+		norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len / max(avg_len, 1e-9))
+		for term in set(query_terms):
+			i = self._lookup.get(term)
+			if i is None or not idf.get(term):
+				continue
+			start, end = self.offsets[i], self.offsets[i + 1]
+			ids = self.chunk_ids[start:end]
+			tf = self.tfs[start:end].astype(np.float32)
+			scores[ids] += idf[term] * tf * (BM25_K1 + 1) / (tf + norm[ids])
+		return scores
+
+
+def collection_stats(indexes: List[LexicalIndex], query_terms: List[str]) -> Tuple[Dict[str, float], float]:
+	"""IDF of the query terms and average chunk length across `indexes`"""
+	total_chunks = sum(ix.num_chunks for ix in indexes)
+	total_len = sum(int(ix.doc_len.sum()) for ix in indexes)
+	idf = {}
+	for term in set(query_terms):
+		df = sum(ix.document_frequency(term) for ix in indexes)
+		if df:
+			idf[term] = math.log(1 + (total_chunks - df + 0.5) / (df + 0.5))
+	return idf, total_len / total_chunks if total_chunks else 0.0
+
+
+def shortlist(scores: np.ndarray, limit: int) -> np.ndarray:
+	"""Indices of the top `limit` positive scores, best first"""
+	hits = np.flatnonzero(scores > 0)
+	if len(hits) > limit:
+		hits = hits[np.argpartition(-scores[hits], limit - 1)[:limit]]
+	return hits[np.argsort(-scores[hits], kind="stable")]
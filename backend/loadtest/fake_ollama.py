@@ -0,0 +1,52 @@
+"""Latency-configurable stand-in for Ollama's /api/generate.
+
+Requests are served by at most `parallel` slots, like Ollama's
+OLLAMA_NUM_PARALLEL; the rest queue. Each reply takes `base_latency` plus
+`eval_tokens / tokens_per_sec` seconds and reports Ollama-style durations
+(nanoseconds) that exclude the time spent queued, so the backend's
+`llm_queue_wait` metric behaves as it would against a real server.
+"""
+import asyncio
+import time
+
+from fastapi import FastAPI, Request
+
+from benchmarks.run import stub_ollama_generate
+
+
+def create_fake_ollama(base_latency: float = 0.2, tokens_per_sec: float = 40.0, eval_tokens: int = 120, parallel: int = 1) -> FastAPI:
+	app = FastAPI(title="Fake Ollama")
+	slots = asyncio.Semaphore(max(1, parallel))
+	stats = {"requests": 0, "max_queue": 0, "waiting": 0}
+	app.state.stats = stats
+
+	@app.post("/api/generate")
+	async def generate(request: Request) -> dict:
+		payload = await request.json()
+		stats["requests"] += 1
+		stats["waiting"] += 1
+		stats["max_queue"] = max(stats["max_queue"], stats["waiting"])
+		async with slots:
+			stats["waiting"] -= 1
+			started = time.perf_counter()
+			prompt_tokens = len(payload.get("prompt", "")) // 4
+			eval_seconds = eval_tokens / tokens_per_sec if tokens_per_sec > 0 else 0.0
+			await asyncio.sleep(base_latency + eval_seconds)
+			data = stub_ollama_generate(payload.get("prompt", ""), payload.get("model"), payload.get("context"))
+			total = time.perf_counter() - started
+			data.update({
+				"model": payload.get("model"),
+				"done": True,
+				"total_duration": int(total * 1e9),
+				"prompt_eval_count": prompt_tokens,
+				"prompt_eval_duration": int(base_latency * 1e9),
+				"eval_count": eval_tokens,
+				"eval_duration": int(eval_seconds * 1e9),
+			})
+			return data
+
+	@app.get("/api/tags")
+	async def tags() -> dict:
+		return {"models": [{"name": "fake"}]}
+
+	return app
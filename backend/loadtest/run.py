@@ -0,0 +1,257 @@
+"""End-to-end concurrent load harness.
+
+Boots the real FastAPI app (`main.app`) under uvicorn in-process, pointed at
+a latency-configurable fake Ollama and the in-memory Firestore stand-in, then
+drives a weighted mix of `/upload`, `/files`, `/quiz` and `/summarize`
+traffic from an asyncio client at increasing concurrency. A low-rate
+`/health` probe runs alongside: its latency rising with load means the event
+loop is being blocked.
+
+Run from the backend directory:
+
+	python -m loadtest.run
+	python -m loadtest.run --concurrency 1,8,32 --duration 30 --llm-latency-ms 500 --llm-parallel 2
+	python -m loadtest.run --embedder hash --firestore-latency-ms 25 --output capacity.json
+
+The report gives p50/p95/p99 latency, throughput and error rate per endpoint
+and concurrency level, printed as a table and written as JSON.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import httpx
+import uvicorn
+
+from benchmarks.corpus import build_corpus
+from loadtest.fake_ollama import create_fake_ollama
+
+
+USER_ID = "demo_user_123"  # the routes currently resolve every caller to this mock user
+CONTENT_TYPES = {
+	"pdf": "application/pdf",
+	"docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+	"pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+}
+
+
+def _free_port() -> int:
+	with socket.socket() as sock:
+		sock.bind(("127.0.0.1", 0))
+		return sock.getsockname()[1]
+
+
+def _serve(app, port: int) -> uvicorn.Server:
+	server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+	threading.Thread(target=server.run, daemon=True).start()
+	deadline = time.time() + 60
+	while not server.started:
+		if time.time() > deadline:
+			raise RuntimeError(f"Server on port {port} did not start")
+		time.sleep(0.05)
+	return server
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+	if not sorted_values:
+		return 0.0
+	rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+	return sorted_values[rank]
+
+
+def _parse_mix(mix: str) -> Dict[str, float]:
+	weights = {}
+	for part in mix.split(","):
+		name, _, weight = part.partition("=")
+		weights[name.strip()] = float(weight or 1)
+	unknown = set(weights) - {"upload", "files", "quiz", "summarize"}
+	if unknown:
+		raise SystemExit(f"Unknown endpoints in --mix: {', '.join(sorted(unknown))}")
+	return weights
+
+
+class LoadDriver:
+	def __init__(self, client: httpx.AsyncClient, documents: List[Tuple[str, bytes, str]], num_questions: int):
+		self.client = client
+		self.documents = documents
+		self.num_questions = num_questions
+		self.file_ids: List[str] = []
+
+	async def upload(self, rng: random.Random) -> httpx.Response:
+		filename, content, content_type = rng.choice(self.documents)
+		resp = await self.client.post(f"/upload?user_id={USER_ID}", files={"file": (filename, content, content_type)})
+		if resp.status_code == 200:
+			self.file_ids.append(resp.json()["file_id"])
+		return resp
+
+	async def files(self, rng: random.Random) -> httpx.Response:
+		return await self.client.get("/files", params={"user_id": USER_ID})
+
+	async def quiz(self, rng: random.Random) -> httpx.Response | None:
+		if not self.file_ids:
+			return None
+		return await self.client.post("/quiz", json={"file_id": rng.choice(self.file_ids), "num_questions": self.num_questions})
+
+	async def summarize(self, rng: random.Random) -> httpx.Response | None:
+		if not self.file_ids:
+			return None
+		return await self.client.post("/summarize", json={"file_id": rng.choice(self.file_ids), "max_length": 200})
+
+	async def run_level(self, concurrency: int, duration: float, weights: Dict[str, float]) -> Dict[str, dict]:
+		samples: Dict[str, List[Tuple[float, bool]]] = defaultdict(list)
+		endpoints = list(weights)
+		deadline = time.perf_counter() + duration
+
+		async def _worker(seed: int):
+			rng = random.Random(seed)
+			while time.perf_counter() < deadline:
+				endpoint = rng.choices(endpoints, weights=[weights[e] for e in endpoints])[0]
+				start = time.perf_counter()
+				try:
+					resp = await getattr(self, endpoint)(rng)
+					if resp is None:
+						# No upload has succeeded yet, so there is no document to ask about
+						await asyncio.sleep(0.01)
+						continue
+					ok = resp.status_code < 400
+				except httpx.HTTPError:
+					ok = False
+				samples[endpoint].append((time.perf_counter() - start, ok))
+
+		async def _probe():
+			while time.perf_counter() < deadline:
+				start = time.perf_counter()
+				try:
+					ok = (await self.client.get("/health")).status_code == 200
+				except httpx.HTTPError:
+					ok = False
+				samples["health"].append((time.perf_counter() - start, ok))
+				await asyncio.sleep(0.25)
+
+		started = time.perf_counter()
+		await asyncio.gather(_probe(), *(_worker(concurrency * 1000 + i) for i in range(concurrency)))
+		elapsed = time.perf_counter() - started
+
+		report = {}
+		for endpoint, values in sorted(samples.items()):
+			latencies = sorted(v for v, _ in values)
+			errors = sum(1 for _, ok in values if not ok)
+			report[endpoint] = {
+				"requests": len(values),
+				"errors": errors,
+				"error_rate": errors / len(values) if values else 0.0,
+				"throughput_rps": len(values) / elapsed,
+				"p50_ms": percentile(latencies, 50) * 1000,
+				"p95_ms": percentile(latencies, 95) * 1000,
+				"p99_ms": percentile(latencies, 99) * 1000,
+			}
+		return report
+
+
+def _print_level(concurrency: int, report: Dict[str, dict]) -> None:
+	print(f"\nconcurrency={concurrency}")
+	print(f"  {'endpoint':<12}{'reqs':>7}{'rps':>9}{'err%':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+	for endpoint, r in report.items():
+		print(
+			f"  {endpoint:<12}{r['requests']:>7}{r['throughput_rps']:>9.1f}{r['error_rate'] * 100:>7.1f}"
+			f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}"
+		)
+
+
+async def _drive(base_url: str, documents, args, weights) -> List[dict]:
+	limits = httpx.Limits(max_connections=max(args.levels) + 8)
+	async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+		driver = LoadDriver(client, documents, args.num_questions)
+		for i in range(args.seed_files):
+			resp = await driver.upload(random.Random(i))
+			resp.raise_for_status()
+		print(f"Seeded {len(driver.file_ids)} files")
+
+		levels = []
+		for concurrency in args.levels:
+			report = await driver.run_level(concurrency, args.duration, weights)
+			_print_level(concurrency, report)
+			levels.append({"concurrency": concurrency, "endpoints": report})
+		return levels
+
+
+def main(argv: List[str] | None = None) -> int:
+	parser = argparse.ArgumentParser(description="SmartDocs end-to-end load harness")
+	parser.add_argument("--concurrency", default="1,4,16,32", help="comma-separated client concurrency levels")
+	parser.add_argument("--duration", type=float, default=20.0, help="seconds per concurrency level")
+	parser.add_argument("--mix", default="upload=1,files=4,quiz=3,summarize=2", help="endpoint weights")
+	parser.add_argument("--num-questions", type=int, default=5)
+	parser.add_argument("--seed-files", type=int, default=6, help="documents uploaded before the first level")
+	parser.add_argument("--doc-size", default="small", choices=["small", "medium", "large"])
+	parser.add_argument("--llm-latency-ms", type=float, default=200.0, help="fake Ollama fixed latency per call")
+	parser.add_argument("--llm-tokens-per-sec", type=float, default=40.0)
+	parser.add_argument("--llm-eval-tokens", type=int, default=120)
+	parser.add_argument("--llm-parallel", type=int, default=1, help="fake Ollama concurrent slots (OLLAMA_NUM_PARALLEL)")
+	parser.add_argument("--firestore-latency-ms", type=float, default=0.0, help="artificial in-memory store round trip")
+	parser.add_argument("--embedder", choices=["model", "hash"], default="model")
+	parser.add_argument("--prebuild-pools", action="store_true", help="let uploads schedule question-pool generation")
+	parser.add_argument("--timeout", type=float, default=300.0)
+	parser.add_argument("--output", default="capacity_report.json")
+	args = parser.parse_args(argv)
+	args.levels = [int(c) for c in args.concurrency.split(",") if c]
+	weights = _parse_mix(args.mix)
+	if args.seed_files <= 0 and not weights.get("upload") and (weights.get("quiz") or weights.get("summarize")):
+		raise SystemExit("--mix has quiz/summarize but no upload, so --seed-files must be at least 1")
+
+	workdir = tempfile.mkdtemp(prefix="smartdocs-load-")
+	ollama_port, api_port = _free_port(), _free_port()
+	# Configure the app before importing it; several modules read env at import time
+	os.environ.update({
+		"UPLOAD_DIR": os.path.join(workdir, "uploads"),
+		"DB_BACKEND": "memory",
+		"MOCK_FIRESTORE_LATENCY_MS": str(args.firestore_latency_ms),
+		"OLLAMA_URL": f"http://127.0.0.1:{ollama_port}",
+		"QUESTION_POOL_PREBUILD": "1" if args.prebuild_pools else "0",
+		"LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+	})
+
+	fake = create_fake_ollama(args.llm_latency_ms / 1000, args.llm_tokens_per_sec, args.llm_eval_tokens, args.llm_parallel)
+	_serve(fake, ollama_port)
+
+	import main as backend
+	import rag
+	if args.embedder == "hash":
+		from benchmarks.run import HashEmbedder
+		rag._embedder = HashEmbedder()
+	_serve(backend.app, api_port)
+
+	corpus = build_corpus(os.path.join(workdir, "corpus"), [args.doc_size], list(CONTENT_TYPES))
+	documents = []
+	for name, path in corpus.items():
+		with open(path, "rb") as f:
+			filetype = path.rsplit(".", 1)[-1]
+			documents.append((f"{name}.{filetype}", f.read(), CONTENT_TYPES[filetype]))
+
+	started = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+	levels = asyncio.run(_drive(f"http://127.0.0.1:{api_port}", documents, args, weights))
+
+	report = {
+		"created": started,
+		"environment": {"python": sys.version.split()[0], "platform": platform.platform(), "cpus": os.cpu_count()},
+		"config": {k: v for k, v in vars(args).items() if k != "levels"},
+		"fake_ollama": dict(fake.state.stats),
+		"levels": levels,
+	}
+	with open(args.output, "w", encoding="utf-8") as f:
+		json.dump(report, f, indent=2)
+	print(f"\nCapacity report written to {args.output}")
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
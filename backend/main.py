@@ -1,13 +1,21 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
 import os
 from dotenv import load_dotenv
 
 from routes.upload import router as upload_router
 from routes.quiz import router as quiz_router
 from routes.summarize import router as summarize_router
+from routes.chat import router as chat_router
+from routes.search import router as search_router
+from routes.profiles import router as profiles_router
 from db import initialize_firebase, close_firebase
 from routes import questionbank
+from observability import RequestMetricsMiddleware, configure_logging, metrics_payload, METRICS_CONTENT_TYPE
+from profiling import ProfilingMiddleware
+import archive
+import storage
 
 def ensure_directory(path: str) -> None:
 	if not os.path.exists(path):
@@ -17,6 +25,7 @@ def ensure_directory(path: str) -> None:
 def create_app() -> FastAPI:
 	# Load environment variables from .env if present
 	load_dotenv()
+	configure_logging()
 	app = FastAPI(title="SmartDocs API", version="0.1.0")
 
 	# Updated CORS configuration to include both frontend ports
@@ -33,7 +42,11 @@ def create_app() -> FastAPI:
 		allow_credentials=True,
 		allow_methods=["*"],
 		allow_headers=["*"],
+		expose_headers=["X-Request-ID", "Server-Timing"],
 	)
+	# Added before the metrics middleware so it runs inside it and sees the request ID
+	app.add_middleware(ProfilingMiddleware)
+	app.add_middleware(RequestMetricsMiddleware)
 
 	upload_dir = os.getenv("UPLOAD_DIR", "uploads")
 	ensure_directory(upload_dir)
@@ -41,21 +54,34 @@ def create_app() -> FastAPI:
 	app.include_router(upload_router, prefix="", tags=["upload"])
 	app.include_router(quiz_router, prefix="", tags=["quiz"])
 	app.include_router(summarize_router, prefix="", tags=["summarize"])
+	app.include_router(chat_router, prefix="", tags=["chat"])
+	app.include_router(search_router, prefix="", tags=["search"])
+	app.include_router(profiles_router, prefix="", tags=["debug"])
 
 	@app.on_event("startup")
 	async def startup_event():
 		"""Initialize Firebase on startup"""
 		initialize_firebase()
+		if storage.SWEEP_INTERVAL > 0:
+			app.state.storage_sweeper = asyncio.create_task(storage.run_sweeper())
 
 	@app.on_event("shutdown")
 	async def shutdown_event():
 		"""Cleanup Firebase on shutdown"""
+		sweeper = getattr(app.state, "storage_sweeper", None)
+		if sweeper:
+			sweeper.cancel()
+		archive.shutdown_workers()
 		close_firebase()
 
 	@app.get("/health")
 	async def health() -> dict:
 		return {"status": "ok"}
 
+	@app.get("/metrics", include_in_schema=False)
+	async def metrics() -> Response:
+		return Response(content=metrics_payload(), media_type=METRICS_CONTENT_TYPE)
+
 	return app
 
 
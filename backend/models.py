@@ -22,6 +22,7 @@ class MCQ(BaseModel):
 	answer: str
 	explanation: str | None = None
 	source_chunks: List[str] | None = None
+	file_id: str | None = None
 
 
 class QuizResponse(BaseModel):
@@ -40,3 +41,79 @@ class SummarizeResponse(BaseModel):
 	summary: str
 	key_points: List[str]
 	word_count: int
+
+
+class BatchQuizItem(BaseModel):
+	file_id: str
+	# A zero count would still cost an LLM section asking for "0 questions"
+	num_questions: int = Field(5, ge=1)
+
+
+class BatchQuizRequest(BaseModel):
+	files: List[BatchQuizItem]
+	stream: bool = False
+
+
+class BatchFileResult(BaseModel):
+	file_id: str
+	filename: str | None = None
+	status: str
+	source: str | None = None
+	num_questions: int = 0
+	error: str | None = None
+
+
+class BatchQuizResponse(BaseModel):
+	num_questions: int
+	files: List[BatchFileResult]
+	questions: List[MCQ]
+
+
+class BatchSummarizeRequest(BaseModel):
+	file_ids: List[str]
+	max_length: int = 500
+	stream: bool = False
+
+
+class BatchSummarizeResponse(BaseModel):
+	files: List[BatchFileResult]
+	summaries: List[SummarizeResponse]
+
+
+class ChatRequest(BaseModel):
+	file_id: str
+	message: str
+	session_id: str | None = None
+	k: int = 6
+
+
+class SearchRequest(BaseModel):
+	query: str
+	file_ids: List[str] | None = None  # default: all of the user's documents
+	k: int = 8
+
+
+class SearchHit(BaseModel):
+	file_id: str
+	filename: str
+	text: str
+	distance: float
+
+
+class SearchResponse(BaseModel):
+	hits: List[SearchHit]
+	searched_files: int
+
+
+class ChatSource(BaseModel):
+	text: str
+	distance: float
+
+
+class ChatResponse(BaseModel):
+	session_id: str
+	file_id: str
+	answer: str
+	sources: List[ChatSource]
+	context_tokens: int = 0
+	prompt_eval_count: int | None = None
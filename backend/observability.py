@@ -0,0 +1,186 @@
+"""Request IDs, structured logging and Prometheus metrics.
+
+Every HTTP request gets a request ID (taken from `X-Request-ID` when the
+client sends one) that is stored in a context variable, so it follows the
+request into `asyncio.to_thread` workers and shows up on every log line.
+
+Pipeline code wraps its expensive steps in `stage("extract")` and friends;
+each stage is observed in the `smartdocs_stage_seconds` histogram labelled
+with the endpoint that triggered it, and the per-request breakdown is
+returned in a `Server-Timing` response header. Ollama replies feed the token
+counters so tokens/sec can be tracked per model.
+
+Set `PROMETHEUS_MULTIPROC_DIR` when running several uvicorn workers so
+`/metrics` aggregates across processes.
+"""
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from prometheus_client import (
+	CONTENT_TYPE_LATEST,
+	CollectorRegistry,
+	Counter,
+	Histogram,
+	generate_latest,
+	multiprocess,
+)
+
+
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+endpoint_var: ContextVar[str] = ContextVar("endpoint", default="background")
+_stage_timings_var: ContextVar[Optional[Dict[str, float]]] = ContextVar("stage_timings", default=None)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+REQUEST_SECONDS = Histogram(
+	"smartdocs_request_seconds",
+	"HTTP request latency",
+	["method", "route", "status"],
+	buckets=LATENCY_BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+	"smartdocs_stage_seconds",
+	"Time spent in each pipeline stage",
+	["stage", "endpoint"],
+	buckets=LATENCY_BUCKETS,
+)
+LLM_PROMPT_TOKENS = Counter("smartdocs_llm_prompt_tokens_total", "Prompt tokens evaluated by Ollama", ["model"])
+LLM_EVAL_TOKENS = Counter("smartdocs_llm_eval_tokens_total", "Tokens generated by Ollama", ["model"])
+LLM_EVAL_SECONDS = Counter("smartdocs_llm_eval_seconds_total", "Ollama generation time (eval_duration)", ["model"])
+LLM_TOKENS_PER_SECOND = Histogram(
+	"smartdocs_llm_tokens_per_second",
+	"Generation throughput per Ollama call",
+	["model"],
+	buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 250),
+)
+DEDUP_REMOVED_CHARS = Counter(
+	"smartdocs_dedup_removed_chars_total",
+	"Characters removed before chunking/embedding as page furniture or near-duplicate chunks",
+	["kind"],
+)
+
+
+class RequestIdFilter(logging.Filter):
+	def filter(self, record: logging.LogRecord) -> bool:
+		record.request_id = request_id_var.get()
+		return True
+
+
+def configure_logging() -> None:
+	"""Send app logs to stderr with the current request ID on every line"""
+	root = logging.getLogger()
+	if any(isinstance(f, RequestIdFilter) for h in root.handlers for f in h.filters):
+		return
+	handler = logging.StreamHandler()
+	handler.addFilter(RequestIdFilter())
+	handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"))
+	root.addHandler(handler)
+	root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+
+@contextmanager
+def stage(name: str):
+	"""Time a pipeline stage and record it against the current request"""
+	start = time.perf_counter()
+	try:
+		yield
+	finally:
+		record_stage(name, time.perf_counter() - start)
+
+
+def record_stage(name: str, seconds: float) -> None:
+	STAGE_SECONDS.labels(stage=name, endpoint=endpoint_var.get()).observe(seconds)
+	timings = _stage_timings_var.get()
+	if timings is not None:
+		timings[name] = timings.get(name, 0.0) + seconds
+
+
+def record_ollama(model: str, data: dict, wall_seconds: float) -> None:
+	"""Record Ollama's own timing/token counters (durations are in nanoseconds)"""
+	total = data.get("total_duration", 0) / 1e9
+	eval_count = data.get("eval_count", 0)
+	eval_seconds = data.get("eval_duration", 0) / 1e9
+
+	# Anything Ollama did not account for was spent queued behind other requests (or on the wire)
+	record_stage("llm_queue_wait", max(0.0, wall_seconds - total) if total else 0.0)
+	record_stage("llm_generate", total or wall_seconds)
+
+	LLM_PROMPT_TOKENS.labels(model=model).inc(data.get("prompt_eval_count", 0))
+	LLM_EVAL_TOKENS.labels(model=model).inc(eval_count)
+	LLM_EVAL_SECONDS.labels(model=model).inc(eval_seconds)
+	if eval_count and eval_seconds:
+		LLM_TOKENS_PER_SECOND.labels(model=model).observe(eval_count / eval_seconds)
+
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def _endpoint_label(path: str) -> str:
+	"""Collapse ID-like path segments so metric labels stay low-cardinality"""
+	segments = [("{id}" if any(ch.isdigit() for ch in seg) else seg) for seg in path.strip("/").split("/")]
+	return "/" + "/".join(segments)
+
+
+class RequestMetricsMiddleware:
+	"""ASGI middleware: request ID propagation, request histogram and Server-Timing header"""
+
+	def __init__(self, app):
+		self.app = app
+
+	async def __call__(self, scope, receive, send):
+		if scope["type"] != "http":
+			await self.app(scope, receive, send)
+			return
+
+		headers = dict(scope.get("headers") or [])
+		request_id = headers.get(b"x-request-id", b"").decode("latin-1") or uuid.uuid4().hex
+		timings: Dict[str, float] = {}
+		tokens = (
+			request_id_var.set(request_id),
+			endpoint_var.set(_endpoint_label(scope.get("path", ""))),
+			_stage_timings_var.set(timings),
+		)
+		status = {"code": 500}
+		start = time.perf_counter()
+
+		async def _send(message):
+			if message["type"] == "http.response.start":
+				status["code"] = message["status"]
+				extra = [(b"x-request-id", request_id.encode("latin-1"))]
+				if timings:
+					server_timing = ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
+					extra.append((b"server-timing", server_timing.encode("latin-1")))
+				message = {**message, "headers": list(message.get("headers", [])) + extra}
+			await send(message)
+
+		try:
+			await self.app(scope, receive, _send)
+		finally:
+			elapsed = time.perf_counter() - start
+			route = scope.get("route")
+			# Unmatched paths (404s from scanners) share one label so the series count stays bounded
+			route_label = getattr(route, "path", None) or UNMATCHED_ROUTE
+			REQUEST_SECONDS.labels(method=scope["method"], route=route_label, status=str(status["code"])).observe(elapsed)
+			if scope.get("path") != "/metrics":
+				stages = " ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in timings.items())
+				logging.getLogger("smartdocs.request").info(
+					f"{scope['method']} {scope.get('path')} {status['code']} {elapsed * 1000:.1f}ms {stages}".rstrip()
+				)
+			for var, token in zip((request_id_var, endpoint_var, _stage_timings_var), tokens):
+				var.reset(token)
+
+
+def metrics_payload() -> bytes:
+	if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+		registry = CollectorRegistry()
+		multiprocess.MultiProcessCollector(registry)
+		return generate_latest(registry)
+	return generate_latest()
+
+
+METRICS_CONTENT_TYPE = CONTENT_TYPE_LATEST
@@ -0,0 +1,163 @@
+"""Streaming text extraction for DOCX and PPTX.
+
+python-docx / python-pptx build the whole object model of a package, which
+is slow and memory-hungry for large decks, and `extract_text` only ever read
+body paragraphs and shape text from it. Here the OOXML parts are read
+straight out of the zip and fed through lxml's incremental parser, so only
+the text-bearing parts are decompressed (media is never touched) and memory
+stays bounded by the element currently being parsed.
+
+Covered: DOCX body paragraphs, tables and text boxes; PPTX slide text,
+tables and speaker notes, in presentation order. Table rows come out as one
+line with cells separated by " | ".
+"""
+import posixpath
+import zipfile
+from typing import Iterator, List, NamedTuple, Optional
+
+from lxml import etree
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+A = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+P = "{http://schemas.openxmlformats.org/presentationml/2006/main}"
+R = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+MC = "{http://schemas.openxmlformats.org/markup-compatibility/2006}"
+PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+NOTES_REL_TYPE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/notesSlide"
+# Placeholders holding page furniture rather than content
+_SKIP_PLACEHOLDERS = {"sldNum", "dt", "ftr", "hdr", "sldImg"}
+
+
+class _Dialect(NamedTuple):
+	"""Tag names for WordprocessingML vs DrawingML text"""
+	para: str
+	text: str
+	tab: Optional[str]
+	breaks: tuple
+	row: str
+	cell: str
+	shape: Optional[str]
+
+
+_WORD = _Dialect(W + "p", W + "t", W + "tab", (W + "br", W + "cr"), W + "tr", W + "tc", None)
+_DRAWING = _Dialect(A + "p", A + "t", None, (A + "br",), A + "tr", A + "tc", P + "sp")
+
+
+def _iter_part_lines(zf: zipfile.ZipFile, name: str, dialect: _Dialect) -> Iterator[str]:
+	"""Yield the paragraphs (and table rows) of one XML part, in document order.
+
+	lxml only reports the tags we care about; text is accumulated as elements
+	close and finished paragraphs and rows are cleared and detached, so the
+	tree never grows past the element being read.
+	"""
+	tags = [t for t in (*dialect, MC + "Fallback", P + "ph") if isinstance(t, str)] + list(dialect.breaks)
+	paragraphs: List[List[str]] = []
+	# Open table cells, rows and shapes collect their lines here before being emitted
+	containers: List[List[str]] = []
+	skipped_shapes: List[bool] = []
+	fallback_depth = 0
+
+	def emit(line: str) -> Iterator[str]:
+		if containers:
+			containers[-1].append(line)
+		else:
+			yield line
+
+	with zf.open(name) as part:
+		for event, elem in etree.iterparse(part, events=("start", "end"), tag=tags, resolve_entities=False):
+			tag = elem.tag
+			if event == "start":
+				if tag == MC + "Fallback":
+					# Same content as the mc:Choice branch, in an older format
+					fallback_depth += 1
+				elif fallback_depth:
+					continue
+				elif tag == dialect.para:
+					paragraphs.append([])
+				elif tag in (dialect.row, dialect.cell, dialect.shape):
+					containers.append([])
+					if tag == dialect.shape:
+						skipped_shapes.append(False)
+				elif tag == P + "ph" and skipped_shapes and elem.get("type") in _SKIP_PLACEHOLDERS:
+					skipped_shapes[-1] = True
+				continue
+
+			if tag == MC + "Fallback":
+				fallback_depth -= 1
+			elif fallback_depth:
+				continue
+			elif tag == dialect.text:
+				if paragraphs and elem.text:
+					paragraphs[-1].append(elem.text)
+			elif tag == dialect.tab:
+				# w:tab is also a tab-stop definition under w:pPr/w:tabs; only a run's w:tab is text
+				if paragraphs and elem.getparent() is not None and elem.getparent().tag == W + "r":
+					paragraphs[-1].append("\t")
+			elif tag in dialect.breaks:
+				if paragraphs:
+					paragraphs[-1].append("\n")
+			elif tag == dialect.para:
+				yield from emit("".join(paragraphs.pop()))
+			elif tag == dialect.cell:
+				yield from emit(" ".join(" ".join(containers.pop()).split()))
+			elif tag == dialect.row:
+				cells = containers.pop()
+				if any(cells):
+					yield from emit(" | ".join(cells))
+			elif tag == dialect.shape:
+				lines = containers.pop()
+				if not skipped_shapes.pop():
+					for line in lines:
+						yield from emit(line)
+
+			if tag in (dialect.para, dialect.row, dialect.shape):
+				elem.clear(keep_tail=True)
+				parent = elem.getparent()
+				while parent is not None and elem.getprevious() is not None:
+					del parent[0]
+
+
+def _rels(zf: zipfile.ZipFile, part: str) -> dict:
+	"""Relationship id -> (type, resolved part name) for `part`"""
+	directory, filename = posixpath.split(part)
+	rels_name = posixpath.join(directory, "_rels", filename + ".rels")
+	if rels_name not in zf.namelist():
+		return {}
+	rels = {}
+	for rel in etree.fromstring(zf.read(rels_name)).iter(PKG_REL + "Relationship"):
+		if rel.get("TargetMode") == "External":
+			continue
+		target = rel.get("Target", "")
+		resolved = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join(directory, target))
+		rels[rel.get("Id")] = (rel.get("Type", ""), resolved)
+	return rels
+
+
+def iter_docx_lines(filepath: str) -> Iterator[str]:
+	with zipfile.ZipFile(filepath) as zf:
+		yield from _iter_part_lines(zf, "word/document.xml", _WORD)
+
+
+def iter_pptx_slides(filepath: str) -> Iterator[List[str]]:
+	"""Lines of each slide (text, tables, then speaker notes), in presentation order"""
+	with zipfile.ZipFile(filepath) as zf:
+		presentation = "ppt/presentation.xml"
+		rels = _rels(zf, presentation)
+		# presentation.xml is small: the slide list plus sizes and default styles
+		root = etree.fromstring(zf.read(presentation))
+		slides = [rels[s.get(R + "id")][1] for s in root.iter(P + "sldId") if s.get(R + "id") in rels]
+		names = set(zf.namelist())
+		for slide in slides:
+			if slide not in names:
+				continue
+			lines = list(_iter_part_lines(zf, slide, _DRAWING))
+			for rel_type, target in _rels(zf, slide).values():
+				if rel_type == NOTES_REL_TYPE and target in names:
+					lines.extend(_iter_part_lines(zf, target, _DRAWING))
+			yield lines
+
+
+def iter_pptx_lines(filepath: str) -> Iterator[str]:
+	for lines in iter_pptx_slides(filepath):
+		yield from lines
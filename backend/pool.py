@@ -0,0 +1,360 @@
+"""Pre-generated per-document question pools.
+
+Generating MCQs is a full LLM round trip, but students hit the same documents
+over and over. Instead of prompting on every `/quiz` call, a background worker
+walks every chunk of a document once, asks the LLM for a handful of questions
+per window of chunks, drops near-duplicates by embedding similarity and stores
+the result next to the upload (`<UPLOAD_DIR>/.pools/<file_id>.json`).
+
+`/quiz` and `/questionbank` then answer by sampling from the pool, preferring
+questions that have been served least often. When the number of never-served
+questions drops below the low-water mark the pool is topped up asynchronously.
+"""
+import json
+import logging
+import math
+import os
+import random
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from rag import load_chunks, chunk_hash, generate_mcqs, _get_embedder, build_or_load_vectorstore, has_index
+from observability import stage
+from storage import touch
+
+logger = logging.getLogger(__name__)
+
+
+POOL_TARGET_SIZE = int(os.getenv("QUESTION_POOL_TARGET", "60"))
+POOL_LOW_WATER = int(os.getenv("QUESTION_POOL_LOW_WATER", "15"))
+POOL_MAX_SIZE = int(os.getenv("QUESTION_POOL_MAX", "400"))
+POOL_WINDOW_CHUNKS = int(os.getenv("QUESTION_POOL_WINDOW", "3"))
+POOL_MAX_PER_WINDOW = int(os.getenv("QUESTION_POOL_BATCH", "8"))
+POOL_DEDUP_THRESHOLD = float(os.getenv("QUESTION_POOL_DEDUP_THRESHOLD", "0.92"))
+
+_executor = ThreadPoolExecutor(
+	max_workers=int(os.getenv("QUESTION_POOL_WORKERS", "1")),
+	thread_name_prefix="question-pool",
+)
+# Queued (not yet started) fills per file: {"filepath", "windows": set of window numbers, "top_up": bool}
+_pending: Dict[str, dict] = {}
+_running: set = set()
+_pending_guard = threading.Lock()
+_file_locks: Dict[str, threading.Lock] = {}
+# Bumped whenever a file's text changes; fills started on an older version stop merging
+_generations: Dict[str, int] = {}
+
+
+def _lock_for(file_id: str) -> threading.Lock:
+	with _pending_guard:
+		if file_id not in _file_locks:
+			_file_locks[file_id] = threading.Lock()
+		return _file_locks[file_id]
+
+
+def _generation(file_id: str) -> int:
+	with _pending_guard:
+		return _generations.get(file_id, 0)
+
+
+def get_pool_dir() -> str:
+	pool_dir = os.path.join(os.getenv("UPLOAD_DIR", "uploads"), ".pools")
+	if not os.path.exists(pool_dir):
+		os.makedirs(pool_dir, exist_ok=True)
+	return pool_dir
+
+
+def _pool_path(file_id: str) -> str:
+	return os.path.join(get_pool_dir(), f"{file_id}.json")
+
+
+def load_pool(file_id: str) -> Optional[dict]:
+	path = _pool_path(file_id)
+	if not os.path.exists(path):
+		return None
+	touch(path)
+	try:
+		with open(path, "r", encoding="utf-8") as f:
+			return json.load(f)
+	except (OSError, json.JSONDecodeError) as e:
+		logger.warning(f"Question pool for {file_id} unreadable, ignoring: {e}")
+		return None
+
+
+def _save_pool(pool: dict) -> None:
+	path = _pool_path(pool["file_id"])
+	# Unique per process and thread: uvicorn workers save the same pool concurrently. The last
+	# replace wins, so `served` counts are best-effort across workers (exact within one).
+	tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+	with open(tmp_path, "w", encoding="utf-8") as f:
+		json.dump(pool, f)
+	os.replace(tmp_path, path)
+
+
+def delete_pool(file_id: str) -> None:
+	path = _pool_path(file_id)
+	if os.path.exists(path):
+		os.remove(path)
+
+
+def _fresh_count(pool: dict) -> int:
+	return sum(1 for q in pool["questions"] if q.get("served", 0) == 0)
+
+
+def _public(question: dict) -> dict:
+	return {
+		"question": question["question"],
+		"options": question["options"],
+		"answer": question["answer"],
+		"explanation": question.get("explanation"),
+		"source_chunks": question.get("source_chunks", []),
+	}
+
+
+# Stems that only make sense next to their options ("Which of the following...", "All of the above")
+_OPTION_REFERENCE_RE = re.compile(
+	r"\b(?:(?:which|what|who) of (?:the following|these|those)|the following (?:is|are|statements?|options?|choices?)"
+	r"|(?:all|none|both) of the above|(?:select|choose|pick) (?:the|one|all|two)\b.*\b(?:options?|answers?|choices?))",
+	re.IGNORECASE,
+)
+
+
+def is_standalone(question: dict) -> bool:
+	"""Whether a pooled MCQ's stem can be asked without its options (for the question bank)"""
+	return not _OPTION_REFERENCE_RE.search(question.get("question", ""))
+
+
+def sample(file_id: str, num_questions: int, eligible: Optional[Callable[[dict], bool]] = None) -> Optional[List[dict]]:
+	"""Serve `num_questions` from the pool, or None if the pool cannot cover the request.
+
+	Least-served questions are picked first so repeated quizzes on the same
+	document rotate through the pool before repeating anything. `eligible`
+	restricts which pooled questions may be served.
+	"""
+	with _lock_for(file_id), stage("pool_sample"):
+		pool = load_pool(file_id)
+		if not pool:
+			return None
+		candidates = [i for i, q in enumerate(pool["questions"]) if eligible is None or eligible(q)]
+		if len(candidates) < num_questions:
+			return None
+
+		order = sorted(
+			candidates,
+			key=lambda i: (pool["questions"][i].get("served", 0), random.random()),
+		)
+		picked = order[:num_questions]
+		for i in picked:
+			pool["questions"][i]["served"] = pool["questions"][i].get("served", 0) + 1
+		_save_pool(pool)
+		fresh = _fresh_count(pool)
+		selected = [_public(pool["questions"][i]) for i in picked]
+
+	if fresh < POOL_LOW_WATER:
+		schedule_fill(file_id, pool["filepath"])
+	return selected
+
+
+def _embed(texts: List[str]):
+	"""Normalised embeddings for dedup, or None when no embedder is available"""
+	if not texts:
+		return None
+	try:
+		import numpy as np
+		vectors = np.asarray(_get_embedder().embed_documents(texts), dtype="float32")
+		norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+		norms[norms == 0] = 1.0
+		return vectors / norms
+	except Exception as e:
+		logger.warning(f"Question pool dedup falling back to exact matching: {e}")
+		return None
+
+
+def _dedup(existing: List[dict], candidates: List[dict]) -> List[dict]:
+	"""Return the candidates that are not near-duplicates of each other or of `existing`"""
+	seen_text = {q["question"].strip().lower() for q in existing}
+	unique = []
+	for q in candidates:
+		key = q["question"].strip().lower()
+		if key and key not in seen_text:
+			seen_text.add(key)
+			unique.append(q)
+	if not unique:
+		return []
+
+	texts = [q["question"] for q in existing] + [q["question"] for q in unique]
+	vectors = _embed(texts)
+	if vectors is None:
+		return unique
+
+	import numpy as np
+	kept_rows = list(range(len(existing)))
+	accepted = []
+	for offset, q in enumerate(unique):
+		row = len(existing) + offset
+		if kept_rows:
+			sims = vectors[kept_rows] @ vectors[row]
+			if float(np.max(sims)) >= POOL_DEDUP_THRESHOLD:
+				continue
+		kept_rows.append(row)
+		accepted.append(q)
+	return accepted
+
+
+def _merge(file_id: str, filepath: str, num_chunks: int, cursor: int, new_questions: List[dict], generation: int) -> Optional[dict]:
+	"""Dedup `new_questions` against the stored pool and persist the result.
+
+	Returns None without saving if the file changed since `generation`: the
+	questions came from text that is no longer there.
+	"""
+	with _lock_for(file_id):
+		if _generation(file_id) != generation:
+			return None
+		pool = load_pool(file_id) or {
+			"file_id": file_id,
+			"filepath": filepath,
+			"num_chunks": num_chunks,
+			"cursor": 0,
+			"questions": [],
+		}
+		accepted = _dedup(pool["questions"], new_questions)
+		pool["questions"].extend(accepted)
+		if len(pool["questions"]) > POOL_MAX_SIZE:
+			# Evict the most-served questions first
+			pool["questions"].sort(key=lambda q: q.get("served", 0))
+			pool["questions"] = pool["questions"][:POOL_MAX_SIZE]
+		pool["filepath"] = filepath
+		pool["num_chunks"] = num_chunks
+		pool["cursor"] = cursor
+		_save_pool(pool)
+		return pool
+
+
+def fill_pool(file_id: str, filepath: str, windows_needed: Optional[List[int]] = None) -> Optional[dict]:
+	"""Generate questions for `file_id` until the pool is healthy.
+
+	A brand-new pool covers every chunk window once. Top-ups continue from
+	the stored cursor and stop once enough fresh questions exist or a full
+	pass over the document adds nothing new (the pool is saturated).
+	`windows_needed` restricts generation to those chunk windows, which is
+	how re-uploads cover only their new or changed chunks.
+	"""
+	generation = _generation(file_id)
+	chunks, dedup = load_chunks(filepath)
+	if not chunks:
+		return None
+
+	# The chunks are already in hand, so index them for /chat retrieval too
+	if not has_index(file_id):
+		try:
+			build_or_load_vectorstore(file_id, chunks, dedup)
+		except Exception as e:
+			logger.warning(f"Indexing {file_id} failed: {e}")
+
+	existing = load_pool(file_id)
+	windows = [chunks[i:i + POOL_WINDOW_CHUNKS] for i in range(0, len(chunks), POOL_WINDOW_CHUNKS)]
+	per_window = max(2, min(POOL_MAX_PER_WINDOW, math.ceil(POOL_TARGET_SIZE / len(windows))))
+	cursor = existing.get("cursor", 0) % len(windows) if existing else 0
+	is_initial = existing is None
+	if windows_needed is not None:
+		order = [i for i in windows_needed if i < len(windows)]
+	else:
+		order = [(cursor + step) % len(windows) for step in range(len(windows))]
+
+	pool = existing
+	for index in order:
+		questions = generate_mcqs(windows[index], per_window)
+		hashes = [chunk_hash(c) for c in windows[index]]
+		for q in questions:
+			q["chunk_hashes"] = hashes
+			q["served"] = 0
+		merged = _merge(file_id, filepath, len(chunks), (index + 1) % len(windows), questions, generation)
+		if merged is None:
+			logger.info(f"Question pool fill for {file_id} superseded by a new version of the file")
+			return None
+		pool = merged
+
+		if windows_needed is None and not is_initial and _fresh_count(pool) >= POOL_TARGET_SIZE // 2:
+			break
+		if len(pool["questions"]) >= POOL_MAX_SIZE:
+			break
+
+	if pool is not None:
+		logger.info(f"Question pool for {file_id}: {len(pool['questions'])} questions, {_fresh_count(pool)} unserved")
+	return pool
+
+
+def carry_over(file_id: str, filepath: str, chunks: List[str]) -> dict:
+	"""Keep pooled questions whose source chunks all survive in the new version of a file"""
+	live = {chunk_hash(c) for c in chunks}
+	with _lock_for(file_id):
+		with _pending_guard:
+			_generations[file_id] = _generations.get(file_id, 0) + 1
+		pool = load_pool(file_id)
+		if not pool:
+			return {"pool_kept": 0, "pool_dropped": 0}
+		kept = [
+			q for q in pool["questions"]
+			if q.get("chunk_hashes") and all(h in live for h in q["chunk_hashes"])
+		]
+		dropped = len(pool["questions"]) - len(kept)
+		pool.update(questions=kept, filepath=filepath, num_chunks=len(chunks))
+		_save_pool(pool)
+	return {"pool_kept": len(kept), "pool_dropped": dropped}
+
+
+def windows_for(chunk_indices: List[int]) -> List[int]:
+	"""Pool window numbers covering the given chunk positions"""
+	return sorted({i // POOL_WINDOW_CHUNKS for i in chunk_indices})
+
+
+def schedule_fill(file_id: str, filepath: str, windows_needed: Optional[List[int]] = None) -> bool:
+	"""Build or top up the pool in the background, or cover `windows_needed` only.
+
+	Requests for a file that is already queued are merged into that job.
+	While a fill is running, plain top-ups are dropped, but window requests
+	(re-uploads) are queued behind it. A running fill that a re-upload makes
+	stale stops at its next merge and is replaced by a top-up of the new version.
+	"""
+	with _pending_guard:
+		job = _pending.get(file_id)
+		if job is None:
+			if windows_needed is None and file_id in _running:
+				return False
+			job = _pending[file_id] = {"filepath": filepath, "windows": set(), "top_up": False}
+			submit = True
+		else:
+			job["filepath"] = filepath
+			submit = False
+		if windows_needed is None:
+			job["top_up"] = True
+		else:
+			job["windows"].update(windows_needed)
+	if submit:
+		_executor.submit(_run_fill, file_id)
+	return True
+
+
+def _run_fill(file_id: str) -> None:
+	with _pending_guard:
+		job = _pending.pop(file_id)
+		_running.add(file_id)
+	generation = _generation(file_id)
+	try:
+		if job["windows"]:
+			fill_pool(file_id, job["filepath"], sorted(job["windows"]))
+		if job["top_up"]:
+			fill_pool(file_id, job["filepath"])
+	except Exception as e:
+		logger.warning(f"Question pool generation failed for {file_id}: {e}")
+	finally:
+		with _pending_guard:
+			_running.discard(file_id)
+
+	if _generation(file_id) != generation:
+		# The file changed under this fill; whatever it did not get to is covered by a top-up of the new text
+		pool = load_pool(file_id)
+		if pool is not None:
+			schedule_fill(file_id, pool["filepath"])
@@ -0,0 +1,270 @@
+"""Opt-in per-request wall-clock sampling profiler.
+
+A request is profiled when it carries `X-Profile: 1` together with the admin
+token from `PROFILE_ADMIN_TOKEN` (header `X-Profile-Token`), or when it is
+picked by random sampling at `PROFILE_SAMPLE_RATE` (0 disables it).
+
+While the request runs, a sampler thread snapshots the Python stack of every
+busy thread every `PROFILE_INTERVAL_MS` milliseconds. That covers the event
+loop running the handler as well as the `asyncio.to_thread` / executor
+workers it hands extraction, embedding and LLM calls to. Idle threads
+(parked in a selector, lock or queue) are skipped. Stacks of other requests
+running at the same moment are included too; the profile records how many
+requests were in flight so such overlap is visible.
+
+Each profile is written twice into `PROFILE_DIR`: a speedscope JSON file
+(open at https://www.speedscope.app) and a folded-stack file for
+flamegraph.pl. Only the newest `PROFILE_RING_SIZE` profiles are kept.
+"""
+import asyncio
+import hmac
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from observability import request_id_var
+
+logger = logging.getLogger(__name__)
+
+
+Frame = Tuple[str, str, int]
+
+_IDLE_LEAVES = {
+	("selectors.py", "select"),
+	("threading.py", "wait"),
+	("threading.py", "_wait_for_tstate_lock"),
+	("thread.py", "_worker"),
+	("queue.py", "get"),
+	("base_events.py", "_run_once"),
+}
+_in_flight = 0
+_in_flight_guard = threading.Lock()
+
+
+def get_profile_dir() -> str:
+	profile_dir = os.getenv("PROFILE_DIR", ".profiles")
+	if not os.path.exists(profile_dir):
+		os.makedirs(profile_dir, exist_ok=True)
+	return profile_dir
+
+
+def is_admin(token: str | None) -> bool:
+	expected = os.getenv("PROFILE_ADMIN_TOKEN")
+	if not expected or token is None:
+		return False
+	return hmac.compare_digest(token.encode("utf-8"), expected.encode("utf-8"))
+
+
+class StackSampler(threading.Thread):
+	"""Background thread collecting (stack, weight) samples per thread name"""
+
+	def __init__(self, interval: float):
+		super().__init__(name="profile-sampler", daemon=True)
+		self.interval = interval
+		self.samples: Dict[str, List[Tuple[List[Frame], float]]] = defaultdict(list)
+		self.started_at = time.perf_counter()
+		self.duration = 0.0
+		self._stop_event = threading.Event()
+
+	@staticmethod
+	def _stack(frame) -> List[Frame]:
+		stack = []
+		while frame is not None:
+			code = frame.f_code
+			stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+			frame = frame.f_back
+		stack.reverse()
+		return stack
+
+	@staticmethod
+	def _is_idle(stack: List[Frame]) -> bool:
+		name, filename, _ = stack[-1]
+		return (os.path.basename(filename), name) in _IDLE_LEAVES
+
+	def run(self) -> None:
+		own = threading.get_ident()
+		last = time.perf_counter()
+		while not self._stop_event.wait(self.interval):
+			now = time.perf_counter()
+			weight, last = now - last, now
+			names = {t.ident: t.name for t in threading.enumerate()}
+			for ident, frame in sys._current_frames().items():
+				if ident == own:
+					continue
+				stack = self._stack(frame)
+				if stack and not self._is_idle(stack):
+					self.samples[names.get(ident, str(ident))].append((stack, weight))
+
+	def stop(self) -> None:
+		self._stop_event.set()
+		self.join()
+		self.duration = time.perf_counter() - self.started_at
+
+
+def _to_speedscope(sampler: StackSampler, title: str) -> dict:
+	frame_index: Dict[Frame, int] = {}
+	frames = []
+
+	def _index(frame: Frame) -> int:
+		if frame not in frame_index:
+			frame_index[frame] = len(frames)
+			frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+		return frame_index[frame]
+
+	profiles = []
+	for thread_name, samples in sampler.samples.items():
+		profiles.append({
+			"type": "sampled",
+			"name": thread_name,
+			"unit": "seconds",
+			"startValue": 0,
+			"endValue": sampler.duration,
+			"samples": [[_index(f) for f in stack] for stack, _ in samples],
+			"weights": [weight for _, weight in samples],
+		})
+	return {
+		"$schema": "https://www.speedscope.app/file-format-schema.json",
+		"name": title,
+		"exporter": "smartdocs-profiler",
+		"shared": {"frames": frames},
+		"profiles": profiles,
+	}
+
+
+def _to_folded(sampler: StackSampler) -> str:
+	"""Brendan Gregg's folded format; weights are in microseconds"""
+	totals: Dict[str, float] = defaultdict(float)
+	for thread_name, samples in sampler.samples.items():
+		for stack, weight in samples:
+			line = ";".join([thread_name] + [f"{name} ({os.path.basename(filename)}:{lineno})" for name, filename, lineno in stack])
+			totals[line] += weight
+	return "\n".join(f"{line} {int(us * 1e6)}" for line, us in totals.items()) + "\n"
+
+
+def _write_profile(profile_id: str, sampler: StackSampler, meta: dict) -> None:
+	profile_dir = get_profile_dir()
+	title = f"{meta['method']} {meta['path']} ({meta['duration_ms']:.0f} ms)"
+	with open(os.path.join(profile_dir, f"{profile_id}.speedscope.json"), "w", encoding="utf-8") as f:
+		json.dump({**_to_speedscope(sampler, title), "smartdocs": meta}, f)
+	with open(os.path.join(profile_dir, f"{profile_id}.folded"), "w", encoding="utf-8") as f:
+		f.write(_to_folded(sampler))
+	_trim_ring(profile_dir)
+
+
+def _trim_ring(profile_dir: str) -> None:
+	ring_size = int(os.getenv("PROFILE_RING_SIZE", "20"))
+	ids = sorted({name.split(".", 1)[0] for name in os.listdir(profile_dir) if name.endswith((".speedscope.json", ".folded"))})
+	for stale in ids[:-ring_size] if ring_size > 0 else ids:
+		for suffix in (".speedscope.json", ".folded"):
+			path = os.path.join(profile_dir, stale + suffix)
+			if os.path.exists(path):
+				os.remove(path)
+
+
+def list_profiles() -> List[dict]:
+	"""Newest-first metadata for the profiles currently in the ring"""
+	profile_dir = get_profile_dir()
+	items = []
+	for name in sorted(os.listdir(profile_dir), reverse=True):
+		if not name.endswith(".speedscope.json"):
+			continue
+		profile_id = name[:-len(".speedscope.json")]
+		path = os.path.join(profile_dir, name)
+		try:
+			with open(path, "r", encoding="utf-8") as f:
+				meta = json.load(f).get("smartdocs", {})
+		except (OSError, json.JSONDecodeError):
+			meta = {}
+		items.append({
+			"profile_id": profile_id,
+			"speedscope": f"{profile_id}.speedscope.json",
+			"folded": f"{profile_id}.folded",
+			"size_bytes": os.path.getsize(path),
+			**meta,
+		})
+	return items
+
+
+def profile_path(filename: str) -> str | None:
+	"""Resolve a file in the ring, rejecting anything outside PROFILE_DIR"""
+	if os.path.basename(filename) != filename or not filename.endswith((".speedscope.json", ".folded")):
+		return None
+	path = os.path.join(get_profile_dir(), filename)
+	return path if os.path.exists(path) else None
+
+
+class ProfilingMiddleware:
+	"""ASGI middleware that profiles admin-requested or randomly sampled requests"""
+
+	def __init__(self, app):
+		self.app = app
+		self.sample_rate = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+		self.interval = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+		# Sampling every thread is not free; profile at most this many requests at once
+		self._slots = threading.BoundedSemaphore(int(os.getenv("PROFILE_MAX_CONCURRENT", "2")))
+
+	def _wanted(self, scope) -> bool:
+		headers = dict(scope.get("headers") or [])
+		if headers.get(b"x-profile") == b"1":
+			return is_admin(headers.get(b"x-profile-token", b"").decode("latin-1"))
+		return self.sample_rate > 0 and random.random() < self.sample_rate
+
+	async def __call__(self, scope, receive, send):
+		global _in_flight
+		if scope["type"] != "http":
+			await self.app(scope, receive, send)
+			return
+
+		with _in_flight_guard:
+			_in_flight += 1
+		try:
+			if not self._wanted(scope) or not self._slots.acquire(blocking=False):
+				await self.app(scope, receive, send)
+				return
+			try:
+				await self._profiled(scope, receive, send)
+			finally:
+				self._slots.release()
+		finally:
+			with _in_flight_guard:
+				_in_flight -= 1
+
+	async def _profiled(self, scope, receive, send):
+		profile_id = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{uuid.uuid4().hex[:8]}"
+		status = {"code": 500}
+
+		async def _send(message):
+			if message["type"] == "http.response.start":
+				status["code"] = message["status"]
+				message = {**message, "headers": list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode("latin-1"))]}
+			await send(message)
+
+		concurrent = _in_flight
+		sampler = StackSampler(self.interval)
+		sampler.start()
+		try:
+			await self.app(scope, receive, _send)
+		finally:
+			sampler.stop()
+			meta = {
+				"method": scope["method"],
+				"path": scope.get("path", ""),
+				"status": status["code"],
+				"request_id": request_id_var.get(),
+				"duration_ms": sampler.duration * 1000,
+				"samples": sum(len(s) for s in sampler.samples.values()),
+				"concurrent_requests": concurrent,
+				"created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+			}
+			try:
+				await asyncio.to_thread(_write_profile, profile_id, sampler, meta)
+				logger.info(f"Profile {profile_id} written for {meta['method']} {meta['path']} ({meta['duration_ms']:.0f} ms)")
+			except Exception as e:
+				logger.warning(f"Failed to write profile {profile_id}: {e}")
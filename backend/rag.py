@@ -1,53 +1,156 @@
 import os
 from typing import List, Tuple, Dict
+import hashlib
 import json
+import logging
 import subprocess
+import threading
+import time
+import zlib
 import httpx
+import numpy as np
 
 import fitz  # PyMuPDF
 import pdfplumber
-from docx import Document
-from pptx import Presentation
 
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
+from observability import stage, record_ollama, DEDUP_REMOVED_CHARS
+from ooxml import iter_docx_lines, iter_pptx_slides
+from dedup import strip_page_furniture, drop_near_duplicates
+from storage import touch
+from lexical import LexicalIndex, collection_stats, shortlist, tokenize
+
+logger = logging.getLogger(__name__)
+
+
+def extract_text(filepath: str, report: dict | None = None) -> str:
+	"""Plain text of a document, minus headers/footers repeated across its pages.
+
+	Pass a dict as `report` to receive counts of what was stripped.
+	"""
+	with stage("extract"):
+		touch(filepath)
+		pages: List[List[str]] = []
+		file_ext = (filepath.split(".")[-1] or "").lower()
+		if file_ext == "pdf":
+			try:
+				with pdfplumber.open(filepath) as pdf:
+					for page in pdf.pages:
+						pages.append((page.extract_text() or "").split("\n"))
+			except Exception:
+				pages = []
+				with fitz.open(filepath) as doc:
+					for page in doc:
+						pages.append(page.get_text().split("\n"))
+		elif file_ext == "docx":
+			# No page structure without layout; headers/footers are not extracted at all
+			pages = [list(iter_docx_lines(filepath))]
+		elif file_ext == "pptx":
+			pages = list(iter_pptx_slides(filepath))
+		else:
+			raise ValueError("Unsupported file type for extraction")
+		pages, stripped = strip_page_furniture(pages)
+		if report is not None:
+			report.update(stripped)
+		return "\n".join(line for lines in pages for line in lines).strip()
+
+
+CHUNK_SIZE = 1500
+CHUNK_OVERLAP = 200
+CHUNK_MIN_SIZE = 500
+# A line ends a chunk when its checksum is divisible by this (once CHUNK_MIN_SIZE is reached)
+_BOUNDARY_MODULUS = 8
+
+
+def chunk_text(raw_text: str, report: dict | None = None) -> List[str]:
+	"""Split text into ~CHUNK_SIZE chunks whose boundaries are chosen by content.
+
+	Chunks end after a line whose checksum hits the boundary condition, so an
+	edit only moves the boundaries around it; chunks elsewhere in the
+	document come out byte-identical and keep their hashes, which is what
+	lets re-uploads reuse embeddings (see `update_vectorstore`). Each chunk
+	starts with up to CHUNK_OVERLAP characters from the end of the previous
+	one (see `_tail`). Near-duplicate chunks are dropped (see `dedup`); pass
+	a dict as `report` to receive counts.
+	"""
+	with stage("chunk"):
+		splitter = RecursiveCharacterTextSplitter(
+			chunk_size=CHUNK_SIZE - CHUNK_OVERLAP,
+			chunk_overlap=0,
+			length_function=len,
+		)
+		lines = []
+		for line in raw_text.split("\n"):
+			line = line.rstrip()
+			if not line.strip():
+				continue
+			lines.extend(splitter.split_text(line) if len(line) > CHUNK_SIZE - CHUNK_OVERLAP else [line])
+
+		chunks: List[str] = []
+		current: List[str] = []
+		size = 0
+		overlap: List[str] = []
+		for line in lines:
+			if current and size + len(line) + 1 > CHUNK_SIZE:
+				chunks.append("\n".join(current))
+				overlap, current, size = _tail(current), [], 0
+			if not current and overlap:
+				current, size = list(overlap), sum(len(l) + 1 for l in overlap)
+			current.append(line)
+			size += len(line) + 1
+			if size >= CHUNK_MIN_SIZE and zlib.crc32(line.encode("utf-8")) % _BOUNDARY_MODULUS == 0:
+				chunks.append("\n".join(current))
+				overlap, current, size = _tail(current), [], 0
+		if current and len(current) > len(overlap):
+			chunks.append("\n".join(current))
+	with stage("dedup"):
+		chunks, dropped = drop_near_duplicates(chunks)
+	if report is not None:
+		report.update(dropped)
+	return chunks
 
-def extract_text(filepath: str) -> str:
-	text = ""
-	file_ext = (filepath.split(".")[-1] or "").lower()
-	if file_ext == "pdf":
-		try:
-			with pdfplumber.open(filepath) as pdf:
-				for page in pdf.pages:
-					page_text = page.extract_text() or ""
-					text += page_text + "\n"
-		except Exception:
-			with fitz.open(filepath) as doc:
-				for page in doc:
-					text += page.get_text() + "\n"
-	elif file_ext == "docx":
-		doc = Document(filepath)
-		for para in doc.paragraphs:
-			text += para.text + "\n"
-	elif file_ext == "pptx":
-		prs = Presentation(filepath)
-		for slide in prs.slides:
-			for shape in slide.shapes:
-				if hasattr(shape, "text"):
-					text += shape.text + "\n"
-	else:
-		raise ValueError("Unsupported file type for extraction")
-	return text.strip()
 
+def _tail(lines: List[str]) -> List[str]:
+	"""Trailing whole lines of a chunk totalling at most CHUNK_OVERLAP characters.
+
+	If the last line alone is longer than that (text extracted without line
+	breaks), its last CHUNK_OVERLAP characters are used instead, starting at
+	a word boundary when there is one.
+	"""
+	tail: List[str] = []
+	size = 0
+	for line in reversed(lines):
+		if size + len(line) + 1 > CHUNK_OVERLAP:
+			break
+		tail.insert(0, line)
+		size += len(line) + 1
+	if not tail and lines:
+		piece = lines[-1][-(CHUNK_OVERLAP - 1):]
+		space = piece.find(" ")
+		if 0 <= space < len(piece) - 1:
+			piece = piece[space + 1:]
+		tail = [piece]
+	return tail
+
+
+def load_chunks(filepath: str) -> Tuple[List[str], dict]:
+	"""Extract and chunk a file, returning the chunks and what dedup removed from it"""
+	report: dict = {}
+	text = extract_text(filepath, report)
+	chunks = chunk_text(text, report) if text.strip() else []
+	if report.get("furniture_lines") or report.get("near_duplicate_chunks"):
+		logger.info(
+			f"{os.path.basename(filepath)}: stripped {report.get('furniture_lines', 0)} repeated header/footer lines, "
+			f"dropped {report.get('near_duplicate_chunks', 0)} near-duplicate chunks "
+			f"({report.get('furniture_chars', 0) + report.get('near_duplicate_chars', 0)} chars)"
+		)
+	return chunks, report
 
-def chunk_text(raw_text: str) -> List[str]:
-	splitter = RecursiveCharacterTextSplitter(
-		chunk_size=1500,
-		chunk_overlap=200,
-		length_function=len,
-	)
-	return splitter.split_text(raw_text)
+
+def chunk_hash(chunk: str) -> str:
+	return hashlib.sha1(chunk.encode("utf-8")).hexdigest()[:16]
 
 
 def get_embeddings_model():
@@ -55,76 +158,330 @@ def get_embeddings_model():
 	return HuggingFaceEmbeddings(model_name=model_name)
 
 
-# Minimal in-memory vector search for small docs (Windows-friendly)
+# Minimal vector search for small docs (Windows-friendly): chunks and their
+# normalised embeddings are persisted per file under <UPLOAD_DIR>/.index/
 _embedder = None
+_index_cache: Dict[str, Tuple[float, List[str], "np.ndarray", str]] = {}
+_INDEX_CACHE_SIZE = int(os.getenv("INDEX_CACHE_SIZE", "32"))
+_lexical_cache: Dict[str, Tuple[float, LexicalIndex]] = {}
+# Chunks kept by the BM25 stage for dense re-scoring, and the reciprocal rank fusion constant
+RETRIEVAL_SHORTLIST = int(os.getenv("RETRIEVAL_SHORTLIST", "48"))
+RRF_K = 60
 
 
 def _get_embedder():
 	global _embedder
 	if _embedder is None:
-		_embedder = get_embeddings_model()
+		server = os.getenv("EMBEDDINGS_SERVER")
+		if server:
+			# Shared model process (see embed_server.py) instead of a per-worker copy
+			from embed_server import EmbeddingClient
+			_embedder = EmbeddingClient(server)
+		else:
+			_embedder = get_embeddings_model()
 	return _embedder
 
 
-def build_or_load_vectorstore(file_id: str, chunks: List[str]):
-	# For development on Windows, we skip persistent vector DB
-	# and keep data in memory for the request lifecycle.
-	# Caller already has chunks; we just return them.
-	return chunks
+def get_index_dir() -> str:
+	index_dir = os.path.join(os.getenv("UPLOAD_DIR", "uploads"), ".index")
+	if not os.path.exists(index_dir):
+		os.makedirs(index_dir, exist_ok=True)
+	return index_dir
+
+
+def _index_paths(file_id: str) -> Tuple[str, str]:
+	base = os.path.join(get_index_dir(), file_id)
+	return f"{base}.json", f"{base}.npy"
+
+
+def _lexical_path(file_id: str) -> str:
+	return os.path.join(get_index_dir(), f"{file_id}.lex.npz")
+
+
+def _normalize(vectors) -> "np.ndarray":
+	matrix = np.asarray(vectors, dtype=np.float32)
+	if matrix.ndim == 1:
+		matrix = matrix.reshape(1, -1)
+	norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+	norms[norms == 0] = 1.0
+	return matrix / norms
+
+
+def _chunks_digest(hashes: List[str]) -> str:
+	"""Identifies one version of a document's chunk list, so the lexical index can be matched to it"""
+	return hashlib.sha1("".join(hashes).encode("ascii")).hexdigest()[:16]
+
+
+def _write_index(file_id: str, chunks: List[str], hashes: List[str], matrix: "np.ndarray", dedup: dict | None = None) -> None:
+	meta_path, vec_path = _index_paths(file_id)
+	# The .json goes last and defines the current version; readers check the other files against it
+	with stage("lexical_index"):
+		LexicalIndex.build(chunks, _chunks_digest(hashes)).save(_lexical_path(file_id))
+	# Temp names are unique per process and thread: another worker may be writing the same index
+	suffix = f"{os.getpid()}.{threading.get_ident()}.tmp"
+	np.save(f"{vec_path}.{suffix}.npy", matrix)
+	os.replace(f"{vec_path}.{suffix}.npy", vec_path)
+	with open(f"{meta_path}.{suffix}", "w", encoding="utf-8") as f:
+		json.dump({"file_id": file_id, "chunks": chunks, "hashes": hashes, "dedup": dedup or {}}, f)
+	os.replace(f"{meta_path}.{suffix}", meta_path)
+	_index_cache.pop(file_id, None)
+	_lexical_cache.pop(file_id, None)
+	if dedup:
+		# Counted once per index build; extraction itself also runs for quizzes, summaries and pools
+		DEDUP_REMOVED_CHARS.labels(kind="furniture").inc(dedup.get("furniture_chars", 0))
+		DEDUP_REMOVED_CHARS.labels(kind="near_duplicate").inc(dedup.get("near_duplicate_chars", 0))
+
+
+def _load_index(file_id: str) -> Tuple[List[str], "np.ndarray", str] | None:
+	"""Stored chunks, their vectors and the chunk list's digest, or None if there is no consistent index"""
+	meta_path, vec_path = _index_paths(file_id)
+	if not (os.path.exists(meta_path) and os.path.exists(vec_path)):
+		return None
+	touch(meta_path)
+	mtime = os.path.getmtime(meta_path)
+	cached = _index_cache.get(file_id)
+	if cached and cached[0] == mtime:
+		return cached[1], cached[2], cached[3]
+	with open(meta_path, "r", encoding="utf-8") as f:
+		meta = json.load(f)
+	stored_chunks = meta["chunks"]
+	matrix = np.load(vec_path)
+	if len(matrix) != len(stored_chunks):
+		# Read between the .npy and .json writes of a re-index, or left that way by a crash
+		logger.warning(f"Index for {file_id} has {len(matrix)} vectors for {len(stored_chunks)} chunks, ignoring it")
+		return None
+	digest = _chunks_digest(meta.get("hashes") or [chunk_hash(c) for c in stored_chunks])
+	if len(_index_cache) >= _INDEX_CACHE_SIZE:
+		_index_cache.pop(next(iter(_index_cache)))
+	_index_cache[file_id] = (mtime, stored_chunks, matrix, digest)
+	return stored_chunks, matrix, digest
+
+
+def build_or_load_vectorstore(file_id: str, chunks: List[str], dedup: dict | None = None) -> Tuple[List[str], "np.ndarray"] | None:
+	"""Embed and persist `chunks` for `file_id`, or load the stored index when `chunks` is empty.
+
+	`dedup` is the removal report from `load_chunks`, kept in the index metadata.
+	"""
+	if chunks:
+		with stage("embed"):
+			matrix = _normalize(_get_embedder().embed_documents(chunks))
+		_write_index(file_id, chunks, [chunk_hash(c) for c in chunks], matrix, dedup)
+		return chunks, matrix
+
+	stored = _load_index(file_id)
+	return (stored[0], stored[1]) if stored else None
+
+
+def update_vectorstore(file_id: str, chunks: List[str], dedup: dict | None = None) -> dict:
+	"""Re-index a new version of a document, embedding only chunks whose hash is new.
+
+	Vectors of chunks that survive unchanged are copied over from the stored
+	index, so a lightly edited document costs a handful of embeddings.
+	"""
+	if not chunks:
+		raise ValueError("No chunks to index")
+	hashes = [chunk_hash(c) for c in chunks]
+	reusable: Dict[str, int] = {}
+	old = build_or_load_vectorstore(file_id, chunks=[])
+	if old is not None:
+		old_chunks, old_matrix = old
+		for row, h in enumerate(chunk_hash(c) for c in old_chunks):
+			reusable.setdefault(h, row)
+
+	missing = [i for i, h in enumerate(hashes) if h not in reusable]
+	new_vectors = None
+	if missing:
+		with stage("embed"):
+			new_vectors = _normalize(_get_embedder().embed_documents([chunks[i] for i in missing]))
+		if reusable and new_vectors.shape[1] != old_matrix.shape[1]:
+			# The embeddings model changed since the last index; nothing is reusable
+			build_or_load_vectorstore(file_id, chunks, dedup)
+			return {"chunks_total": len(chunks), "chunks_reused": 0, "chunks_embedded": len(chunks)}
+
+	dim = new_vectors.shape[1] if new_vectors is not None else old_matrix.shape[1]
+	matrix = np.empty((len(chunks), dim), dtype=np.float32)
+	for i, h in enumerate(hashes):
+		if h in reusable:
+			matrix[i] = old_matrix[reusable[h]]
+	if missing:
+		matrix[missing] = new_vectors
+	_write_index(file_id, chunks, hashes, matrix, dedup)
+	return {
+		"chunks_total": len(chunks),
+		"chunks_reused": len(chunks) - len(missing),
+		"chunks_embedded": len(missing),
+	}
 
 
-def retrieve_context(file_id: str, query: str, k: int = 6) -> List[Tuple[str, float]]:
-	embedder = _get_embedder()
-	# In-memory cosine similarity
-	# Compute embeddings
-	# Note: sentence-transformers returns lists of floats
-	chunk_texts = build_or_load_vectorstore(file_id, chunks=[])
-	if not chunk_texts:
+def has_index(file_id: str) -> bool:
+	meta_path, vec_path = _index_paths(file_id)
+	return os.path.exists(meta_path) and os.path.exists(vec_path)
+
+
+def index_document(file_id: str, filepath: str) -> Tuple[List[str], "np.ndarray"] | None:
+	"""Extract, chunk and embed a file into its persistent index"""
+	chunks, dedup = load_chunks(filepath)
+	if not chunks:
+		return None
+	return build_or_load_vectorstore(file_id, chunks, dedup)
+
+
+def delete_index(file_id: str) -> None:
+	_index_cache.pop(file_id, None)
+	_lexical_cache.pop(file_id, None)
+	for path in (*_index_paths(file_id), _lexical_path(file_id)):
+		if os.path.exists(path):
+			os.remove(path)
+
+
+def _load_lexical(file_id: str, chunks: List[str], digest: str) -> LexicalIndex:
+	"""The document's BM25 index for exactly `chunks`.
+
+	Rebuilt from the chunks when it is missing (indexes that predate hybrid
+	retrieval) or belongs to another version of the document (a re-index in
+	progress or interrupted), so chunk ids always line up with the dense index.
+	"""
+	path = _lexical_path(file_id)
+	index = None
+	if os.path.exists(path):
+		mtime = os.path.getmtime(path)
+		cached = _lexical_cache.get(file_id)
+		index = cached[1] if cached and cached[0] == mtime else LexicalIndex.load(path)
+	if index is None or index.digest != digest or index.num_chunks != len(chunks):
+		with stage("lexical_index"):
+			index = LexicalIndex.build(chunks, digest)
+			index.save(path)
+	if len(_lexical_cache) >= _INDEX_CACHE_SIZE and file_id not in _lexical_cache:
+		_lexical_cache.pop(next(iter(_lexical_cache)))
+	_lexical_cache[file_id] = (os.path.getmtime(path), index)
+	return index
+
+
+def search_documents(file_ids: List[str], query: str, k: int = 6) -> List[Tuple[str, str, float]]:
+	"""Hybrid search over one or more indexed documents.
+
+	BM25 over the documents' inverted indexes (with collection-wide IDF)
+	shortlists up to RETRIEVAL_SHORTLIST chunks; only those are scored against
+	the query embedding, and the two rankings are combined by reciprocal rank
+	fusion. When the documents are small or the query shares too few terms
+	with them, every chunk is scored densely instead.
+
+	Returns (file_id, chunk, distance) with distance = 1 - cosine similarity.
+	"""
+	docs, digests = [], []
+	for file_id in file_ids:
+		index = _load_index(file_id)
+		if index:
+			docs.append((file_id, index[0], index[1]))
+			digests.append(index[2])
+	if not docs or k <= 0:
 		return []
-	chunk_embs = embedder.embed_documents(chunk_texts)
-	query_emb = embedder.embed_query(query)
-	# Cosine similarity
-	import numpy as np
-	q = np.array(query_emb)
-	scores = []
-	for t, e in zip(chunk_texts, chunk_embs):
-		v = np.array(e)
-		den = (np.linalg.norm(q) * np.linalg.norm(v)) or 1.0
-		score = float(np.dot(q, v) / den)
-		scores.append((t, score))
-	scores.sort(key=lambda x: x[1], reverse=True)
-	return [(t, 1 - s) for t, s in scores[:k]]  # smaller is better distance
 
+	terms = tokenize(query)
+	with stage("lexical"):
+		lexical = [_load_lexical(file_id, chunks, digest) for (file_id, chunks, _), digest in zip(docs, digests)]
+		idf, avg_len = collection_stats(lexical, terms)
+		bm25 = np.concatenate([ix.scores(terms, idf, avg_len) for ix in lexical])
+	# (doc, row) for every chunk in the concatenated score vector
+	owners = np.concatenate([np.full(len(chunks), d, dtype=np.int32) for d, (_, chunks, _) in enumerate(docs)])
+	rows = np.concatenate([np.arange(len(chunks), dtype=np.int32) for _, chunks, _ in docs])
+
+	lexical_hits = shortlist(bm25, RETRIEVAL_SHORTLIST)
+	if len(bm25) <= RETRIEVAL_SHORTLIST or len(lexical_hits) < k:
+		candidates = np.arange(len(bm25))
+	else:
+		candidates = lexical_hits
+
+	with stage("embed"):
+		q = _normalize(_get_embedder().embed_query(query))[0]
+	with stage("retrieve"):
+		dense = np.empty(len(candidates), dtype=np.float32)
+		for d, (_, _, matrix) in enumerate(docs):
+			mask = owners[candidates] == d
+			if mask.any():
+				dense[mask] = matrix[rows[candidates[mask]]] @ q
+
+		fused = np.zeros(len(candidates), dtype=np.float64)
+		fused[np.argsort(-dense, kind="stable")] += 1.0 / (RRF_K + 1 + np.arange(len(candidates)))
+		lexical_rank = np.full(len(bm25), np.inf)
+		lexical_rank[lexical_hits] = np.arange(len(lexical_hits))
+		fused += 1.0 / (RRF_K + 1 + lexical_rank[candidates])
+		top = np.argsort(-fused, kind="stable")[:k]
+
+	results = []
+	for i in top:
+		c = candidates[i]
+		file_id, chunks, _ = docs[owners[c]]
+		results.append((file_id, chunks[rows[c]], 1 - float(dense[i])))
+	return results
 
-def _call_ollama(prompt: str, model: str = None) -> str:
-	"""Call Ollama LLM via HTTP API or CLI fallback"""
+
+def retrieve_context(file_id: str, query: str, k: int = 6) -> List[Tuple[str, float]]:
+	return [(chunk, distance) for _, chunk, distance in search_documents([file_id], query, k)]  # smaller is better distance
+
+
+_ollama_client: httpx.Client | None = None
+
+
+def _get_ollama_client() -> httpx.Client:
+	global _ollama_client
+	if _ollama_client is None:
+		_ollama_client = httpx.Client(timeout=120)
+	return _ollama_client
+
+
+def _ollama_generate(prompt: str, model: str = None, context: List[int] | None = None) -> dict | None:
+	"""POST to Ollama's /api/generate and return the full JSON reply (None on failure).
+
+	Passing back the `context` from a previous reply lets Ollama continue from
+	that conversation state instead of re-evaluating the shared prefix, and
+	`keep_alive` keeps the model resident between turns.
+	"""
 	if model is None:
 		model = os.getenv("OLLAMA_MODEL", "llama3.1:8b")
-	
-	# Try HTTP first (ollama serve at 127.0.0.1:11434)
 	try:
-		url = "http://127.0.0.1:11434/api/generate"
+		url = f"{os.getenv('OLLAMA_URL', 'http://127.0.0.1:11434').rstrip('/')}/api/generate"
 		payload = {
 			"model": model, 
 			"prompt": prompt, 
 			"stream": False,
+			"keep_alive": os.getenv("OLLAMA_KEEP_ALIVE", "30m"),
 			"options": {
 				"temperature": 0.7,
 				"top_p": 0.9,
 				"num_predict": 2048
 			}
 		}
-		with httpx.Client(timeout=120) as client:
-			resp = client.post(url, json=payload)
-			if resp.status_code == 200:
-				data = resp.json()
-				return data.get("response", "")
-			else:
-				print(f"Ollama HTTP error: {resp.status_code} - {resp.text}")
+		if context:
+			payload["context"] = context
+		start = time.perf_counter()
+		resp = _get_ollama_client().post(url, json=payload)
+		if resp.status_code == 200:
+			data = resp.json()
+			record_ollama(model, data, time.perf_counter() - start)
+			return data
+		logger.warning(f"Ollama HTTP error: {resp.status_code} - {resp.text}")
 	except Exception as e:
-		print(f"Ollama HTTP request failed: {e}")
+		logger.warning(f"Ollama HTTP request failed: {e}")
+	return None
+
+
+def _call_ollama(prompt: str, model: str = None) -> str:
+	"""Call Ollama LLM via HTTP API or CLI fallback"""
+	if model is None:
+		model = os.getenv("OLLAMA_MODEL", "llama3.1:8b")
 	
-	# Fallback CLI
+	# Try HTTP first (ollama serve at OLLAMA_URL)
+	data = _ollama_generate(prompt, model)
+	if data is not None:
+		return data.get("response", "")
+	return _ollama_cli(prompt, model)
+
+
+def _ollama_cli(prompt: str, model: str = None) -> str:
+	"""Run a prompt through the `ollama` CLI; "" on failure"""
+	if model is None:
+		model = os.getenv("OLLAMA_MODEL", "llama3.1:8b")
 	try:
 		result = subprocess.run(
 			["ollama", "run", model, prompt], 
@@ -135,9 +492,9 @@ def _call_ollama(prompt: str, model: str = None) -> str:
 		if result.returncode == 0:
 			return result.stdout
 		else:
-			print(f"Ollama CLI error: {result.stderr}")
+			logger.warning(f"Ollama CLI error: {result.stderr}")
 	except Exception as e:
-		print(f"Ollama CLI failed: {e}")
+		logger.warning(f"Ollama CLI failed: {e}")
 	
 	return ""
 
@@ -172,27 +529,13 @@ Document content:
 
 Remember: Return ONLY valid JSON, no additional text before or after."""
 
-	response_text = _call_ollama(prompt)
-	
-	if response_text:
-		try:
-			# Clean the response to extract JSON
-			response_text = response_text.strip()
-			if response_text.startswith("```json"):
-				response_text = response_text[7:]
-			if response_text.endswith("```"):
-				response_text = response_text[:-3]
-			
-			payload = json.loads(response_text)
-			if isinstance(payload, dict):
-				return {
-					"summary": payload.get("summary", "Summary generation failed."),
-					"key_points": payload.get("key_points", []),
-					"word_count": payload.get("word_count", 0)
-				}
-		except json.JSONDecodeError as e:
-			print(f"Failed to parse Ollama JSON response: {e}")
-			print(f"Raw response: {response_text[:200]}...")
+	payload = _load_json_response(_call_ollama(prompt))
+	if isinstance(payload, dict):
+		return {
+			"summary": payload.get("summary", "Summary generation failed."),
+			"key_points": payload.get("key_points", []),
+			"word_count": payload.get("word_count", 0)
+		}
 	
 	# Fallback if LLM fails
 	fallback_summary = " ".join(chunks[0].split()[:max_length//5]) if chunks else "No content available."
@@ -203,14 +546,17 @@ Remember: Return ONLY valid JSON, no additional text before or after."""
 	}
 
 
-def generate_quiz_from_chunks(chunks: List[str], num_questions: int = 5) -> List[dict]:
-	"""Generate quiz questions using Ollama LLM"""
+def generate_mcqs(chunks: List[str], num_questions: int = 5) -> List[dict]:
+	"""Ask Ollama for MCQs over the given chunks.
+
+	Returns only questions the LLM actually produced (possibly an empty list);
+	callers decide whether to fall back to placeholder questions.
+	"""
 	if not chunks:
 		return []
-	
-	# Limit context to avoid token limits
-	context = "\n\n".join(chunks[:8]) if len(chunks) > 8 else "\n\n".join(chunks)
-	
+
+	context = "\n\n".join(chunks)
+
 	prompt = f"""You are an expert educator creating multiple-choice questions from study materials.
 
 Create {num_questions} high-quality multiple-choice questions based on the provided content.
@@ -242,36 +588,183 @@ Content to analyze:
 Return ONLY valid JSON, no additional text."""
 
 	response_text = _call_ollama(prompt)
-	
-	if response_text:
-		try:
+	return _parse_mcqs(response_text, num_questions)
+
+
+def _load_json_response(response_text: str):
+	"""Strip markdown fences from an LLM response and decode it as JSON (None on failure)"""
+	if not response_text:
+		return None
+	try:
+		with stage("json_parse"):
 			# Clean the response to extract JSON
 			response_text = response_text.strip()
 			if response_text.startswith("```json"):
 				response_text = response_text[7:]
 			if response_text.endswith("```"):
 				response_text = response_text[:-3]
-			
-			payload = json.loads(response_text)
-			if isinstance(payload, dict) and isinstance(payload.get("questions"), list):
-				questions = []
-				for q in payload["questions"][:num_questions]:
-					if all(key in q for key in ["question", "options", "answer", "explanation"]):
-						questions.append({
-							"question": q["question"],
-							"options": q["options"][:4],  # Ensure exactly 4 options
-							"answer": q["answer"],
-							"explanation": q["explanation"],
-							"source_chunks": q.get("source_chunks", [])
-						})
-				if questions:
-					return questions
-		except json.JSONDecodeError as e:
-			print(f"Failed to parse quiz JSON response: {e}")
-			print(f"Raw response: {response_text[:200]}...")
+			return json.loads(response_text)
+	except json.JSONDecodeError as e:
+		logger.warning(f"Failed to parse Ollama JSON response: {e}")
+		logger.info(f"Raw response: {response_text[:200]}...")
+		return None
+
+
+def _clean_mcq(q) -> dict | None:
+	if not isinstance(q, dict) or not all(key in q for key in ["question", "options", "answer", "explanation"]):
+		return None
+	return {
+		"question": q["question"],
+		"options": q["options"][:4],  # Ensure exactly 4 options
+		"answer": q["answer"],
+		"explanation": q["explanation"],
+		"source_chunks": q.get("source_chunks", [])
+	}
+
+
+def _parse_mcqs(response_text: str, num_questions: int) -> List[dict]:
+	"""Parse the MCQ JSON payload returned by the LLM, dropping malformed entries"""
+	payload = _load_json_response(response_text)
+	if isinstance(payload, dict) and isinstance(payload.get("questions"), list):
+		questions = []
+		for q in payload["questions"][:num_questions]:
+			cleaned = _clean_mcq(q)
+			if cleaned:
+				questions.append(cleaned)
+		return questions
+	return []
+
+
+def generate_mcqs_for_sections(sections: List[Tuple[str, List[str], int]]) -> Dict[str, List[dict]]:
+	"""Generate MCQs for several documents in one LLM call.
+
+	`sections` is a list of (label, chunks, num_questions). Every generated
+	question is tagged by the model with the label of the section it came
+	from; the result maps each label to its questions (missing labels map
+	to an empty list so callers can top up the shortfall).
+	"""
+	results: Dict[str, List[dict]] = {label: [] for label, _, _ in sections}
+	if not sections:
+		return results
+
+	requested = "\n".join(f"- {label}: {n} questions" for label, _, n in sections)
+	content = "\n\n".join(
+		f"=== {label} ===\n" + "\n\n".join(chunks) for label, chunks, _ in sections
+	)
+
+	prompt = f"""You are an expert educator creating multiple-choice questions from study materials.
+
+The content below contains several labelled documents. Create exactly this many questions per document:
+{requested}
+
+Requirements:
+- Each question must be answerable from its own document only
+- Each question must have exactly 4 options (A, B, C, D)
+- Provide clear, unambiguous questions
+- Include brief explanations for correct answers
+- Set "doc" to the label of the document the question is based on
+
+Format your response as valid JSON:
+{{
+  "questions": [
+    {{
+      "doc": "{sections[0][0]}",
+      "question": "What is the main topic discussed in this document?",
+      "options": ["Option A", "Option B", "Option C", "Option D"],
+      "answer": "A",
+      "explanation": "The document clearly states...",
+      "source_chunks": ["Relevant text snippet from the content"]
+    }}
+  ]
+}}
+
+
+Content to analyze:
+{content}
+
+Return ONLY valid JSON, no additional text."""
+
+	payload = _load_json_response(_call_ollama(prompt))
+	if not (isinstance(payload, dict) and isinstance(payload.get("questions"), list)):
+		return results
+
+	limits = {label: n for label, _, n in sections}
+	for q in payload["questions"]:
+		label = str(q.get("doc", "")).strip() if isinstance(q, dict) else ""
+		cleaned = _clean_mcq(q)
+		if cleaned and label in results and len(results[label]) < limits[label]:
+			results[label].append(cleaned)
+	return results
+
+
+def summarize_documents(sections: List[Tuple[str, List[str]]], max_length: int = 500) -> Dict[str, dict]:
+	"""Summarize several short documents in one LLM call.
+
+	Returns a mapping of label to summary dict for the documents the model
+	answered; labels it skipped are absent so callers can retry them alone.
+	"""
+	if not sections:
+		return {}
+
+	content = "\n\n".join(
+		f"=== {label} ===\n" + "\n\n".join(chunks) for label, chunks in sections
+	)
+
+	prompt = f"""You are an expert document summarizer. The content below contains several labelled documents.
+For EACH document provide:
+
+1. A concise summary (maximum {max_length} words)
+2. 5-7 key points or main ideas
+3. The total word count of your summary
+
+Format your response as valid JSON:
+{{
+  "documents": [
+    {{
+      "doc": "{sections[0][0]}",
+      "summary": "Your summary text here...",
+      "key_points": ["Key point 1", "Key point 2", "Key point 3"],
+      "word_count": 123
+    }}
+  ]
+}}
+
+Documents:
+{content}
+
+Remember: Return ONLY valid JSON, no additional text before or after."""
+
+	payload = _load_json_response(_call_ollama(prompt))
+	if not (isinstance(payload, dict) and isinstance(payload.get("documents"), list)):
+		return {}
+
+	labels = {label for label, _ in sections}
+	results = {}
+	for item in payload["documents"]:
+		if not isinstance(item, dict):
+			continue
+		label = str(item.get("doc", "")).strip()
+		if label in labels and item.get("summary"):
+			results[label] = {
+				"summary": item["summary"],
+				"key_points": item.get("key_points", []),
+				"word_count": item.get("word_count", 0)
+			}
+	return results
+
+
+def generate_quiz_from_chunks(chunks: List[str], num_questions: int = 5) -> List[dict]:
+	"""Generate quiz questions using Ollama LLM"""
+	if not chunks:
+		return []
+	
+	# Limit context to avoid token limits
+	questions = generate_mcqs(chunks[:8], num_questions)
+	if questions:
+		return questions
 	
 	# Fallback if LLM fails
-	print("LLM quiz generation failed, using fallback questions")
+	logger.warning("LLM quiz generation failed, using fallback questions")
 	fallback_questions = []
 	for i in range(min(num_questions, len(chunks))):
 		context = chunks[i][:300] if chunks[i] else "No content available"
@@ -311,5 +804,5 @@ def generate_questions_from_chunks(chunks, num_questions):
         return questions
 
     except Exception as e:
-        print(f"Error in generate_questions_from_chunks: {e}")
+        logger.error(f"Error in generate_questions_from_chunks: {e}")
         return []
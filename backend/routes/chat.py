@@ -0,0 +1,57 @@
+import asyncio
+import logging
+import os
+
+from fastapi import APIRouter, HTTPException
+
+from db import get_file_by_id, get_user_from_token
+from models import ChatRequest, ChatResponse
+from rag import has_index, index_document
+from sessions import get_or_create_session, end_session, chat_turn
+
+logger = logging.getLogger(__name__)
+
+
+router = APIRouter()
+
+
+@router.post("/chat", response_model=ChatResponse)
+async def chat(payload: ChatRequest):
+	"""Answer a question about a document using retrieved chunks and the session's Ollama context"""
+	if not payload.message.strip():
+		raise HTTPException(status_code=400, detail="Message is empty")
+
+	user = get_user_from_token()
+	file_info = get_file_by_id(payload.file_id, user.uid)
+	if not file_info:
+		raise HTTPException(status_code=404, detail="File not found")
+	if not os.path.exists(file_info["filepath"]):
+		raise HTTPException(status_code=404, detail="File not found on disk")
+
+	try:
+		# Normally built in the background after upload; build now if it is missing
+		if not has_index(payload.file_id):
+			indexed = await asyncio.to_thread(index_document, payload.file_id, file_info["filepath"])
+			if not indexed:
+				raise HTTPException(status_code=400, detail="Document contains no extractable text")
+
+		session = get_or_create_session(payload.session_id, payload.file_id, user.uid, file_info.get("filename", ""))
+		result = await asyncio.to_thread(chat_turn, session, payload.message, payload.k)
+	except HTTPException:
+		raise
+	except Exception as e:
+		logger.error(f"Chat error: {e}")
+		raise HTTPException(status_code=500, detail=f"Chat failed: {str(e)}")
+
+	if not result["answer"]:
+		raise HTTPException(status_code=502, detail="LLM returned an empty answer")
+
+	return ChatResponse(session_id=session.session_id, file_id=payload.file_id, **result)
+
+
+@router.delete("/chat/{session_id}")
+async def delete_chat_session(session_id: str):
+	user = get_user_from_token()
+	if not end_session(session_id, user.uid):
+		raise HTTPException(status_code=404, detail="Session not found")
+	return {"detail": "Session ended"}
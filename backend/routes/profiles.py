@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import FileResponse
+
+from profiling import is_admin, list_profiles, profile_path
+
+
+router = APIRouter()
+
+
+def _require_admin(token: str | None) -> None:
+	if not is_admin(token):
+		raise HTTPException(status_code=403, detail="Admin token required")
+
+
+@router.get("/debug/profiles")
+async def get_profiles(x_profile_token: str | None = Header(default=None)):
+	"""List captured request profiles, newest first"""
+	_require_admin(x_profile_token)
+	return list_profiles()
+
+
+@router.get("/debug/profiles/{filename}")
+async def download_profile(filename: str, x_profile_token: str | None = Header(default=None)):
+	"""Download a speedscope (`.speedscope.json`) or folded-stack (`.folded`) profile"""
+	_require_admin(x_profile_token)
+	path = profile_path(filename)
+	if not path:
+		raise HTTPException(status_code=404, detail="Profile not found")
+	media_type = "application/json" if filename.endswith(".json") else "text/plain"
+	return FileResponse(path, media_type=media_type, filename=filename)
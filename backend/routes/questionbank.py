@@ -1,8 +1,12 @@
+import logging
 from fastapi import APIRouter, HTTPException
 from models import QuizRequest
 from db import get_file_by_id, get_user_from_token
 import os
 from rag import extract_text, chunk_text, generate_questions_from_chunks
+from pool import is_standalone, sample as sample_pool, schedule_fill
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -17,15 +21,15 @@ async def generate_questionbank(request: QuizRequest):
     from a given document.
     """
     try:
-        print(f"Question bank request: file_id={request.file_id}, num_questions={request.num_questions}")
+        logger.info(f"Question bank request: file_id={request.file_id}, num_questions={request.num_questions}")
 
         # Get mock user for development
         user = get_user_from_token()
-        print(f"Using user: {user.uid}")
+        logger.info(f"Using user: {user.uid}")
 
         # Get file info
         file_info = get_file_by_id(request.file_id, user.uid)
-        print(f"File info: {file_info}")
+        logger.info(f"File info: {file_info}")
 
         if not file_info:
             raise HTTPException(status_code=404, detail="File not found")
@@ -34,17 +38,25 @@ async def generate_questionbank(request: QuizRequest):
         if not os.path.exists(file_path):
             raise HTTPException(status_code=404, detail="File not found on disk")
 
-        # Extract and process text
-        raw_text = extract_text(file_path)
-        if not raw_text.strip():
-            raise HTTPException(status_code=400, detail="No text content found in file")
+        # The question bank only needs the question text, so the MCQ pool serves it too,
+        # minus stems like "Which of the following..." that are meaningless without options
+        pooled = sample_pool(request.file_id, request.num_questions, is_standalone)
+        if pooled is not None:
+            questions = [q["question"] for q in pooled]
+        else:
+            schedule_fill(request.file_id, file_path)
+
+            # Extract and process text
+            raw_text = extract_text(file_path)
+            if not raw_text.strip():
+                raise HTTPException(status_code=400, detail="No text content found in file")
 
-        chunks = chunk_text(raw_text)
-        if not chunks:
-            raise HTTPException(status_code=400, detail="Unable to process document content")
+            chunks = chunk_text(raw_text)
+            if not chunks:
+                raise HTTPException(status_code=400, detail="Unable to process document content")
 
-        # Generate questions only (no options)
-        questions = generate_questions_from_chunks(chunks, request.num_questions)
+            # Generate questions only (no options)
+            questions = generate_questions_from_chunks(chunks, request.num_questions)
 
         if not questions:
             raise HTTPException(status_code=500, detail="Failed to generate questions")
@@ -58,5 +70,5 @@ async def generate_questionbank(request: QuizRequest):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Question bank generation error: {e}")
+        logger.error(f"Question bank generation error: {e}")
         raise HTTPException(status_code=500, detail=f"Question bank generation failed: {str(e)}")
@@ -1,8 +1,14 @@
+import logging
 from fastapi import APIRouter, HTTPException, Depends
-from models import QuizRequest, QuizResponse, MCQ
+from fastapi.responses import StreamingResponse
+from models import QuizRequest, QuizResponse, MCQ, BatchQuizRequest, BatchQuizResponse, BatchFileResult
 from db import get_file_by_id, get_user_from_token
 import os
 from rag import extract_text, chunk_text, generate_quiz_from_chunks
+from pool import sample as sample_pool, schedule_fill
+from batch import run_quiz_batch, ndjson
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -14,15 +20,15 @@ def get_quiz():
 async def generate_quiz(request: QuizRequest):
     """Generate quiz questions from a document"""
     try:
-        print(f"Quiz generation request: file_id={request.file_id}, num_questions={request.num_questions}")
+        logger.info(f"Quiz generation request: file_id={request.file_id}, num_questions={request.num_questions}")
         
         # Get mock user for development
         user = get_user_from_token()
-        print(f"Using user: {user.uid}")
+        logger.info(f"Using user: {user.uid}")
         
         # Get file information
         file_info = get_file_by_id(request.file_id, user.uid)
-        print(f"File info: {file_info}")
+        logger.info(f"File info: {file_info}")
         
         if not file_info:
             raise HTTPException(status_code=404, detail="File not found")
@@ -32,18 +38,24 @@ async def generate_quiz(request: QuizRequest):
         if not os.path.exists(file_path):
             raise HTTPException(status_code=404, detail="File not found on disk")
         
-        # Extract and process text
-        raw_text = extract_text(file_path)
-        if not raw_text.strip():
-            raise HTTPException(status_code=400, detail="No text content found in file")
-        
-        # Chunk the text
-        chunks = chunk_text(raw_text)
-        if not chunks:
-            raise HTTPException(status_code=400, detail="Unable to process document content")
-        
-        # Generate quiz questions
-        quiz_questions = generate_quiz_from_chunks(chunks, request.num_questions)
+        # Serve from the pre-generated question pool when it can cover the request
+        quiz_questions = sample_pool(request.file_id, request.num_questions)
+        if quiz_questions is None:
+            # Pool missing or too small: build it in the background and answer live
+            schedule_fill(request.file_id, file_path)
+            
+            # Extract and process text
+            raw_text = extract_text(file_path)
+            if not raw_text.strip():
+                raise HTTPException(status_code=400, detail="No text content found in file")
+            
+            # Chunk the text
+            chunks = chunk_text(raw_text)
+            if not chunks:
+                raise HTTPException(status_code=400, detail="Unable to process document content")
+            
+            # Generate quiz questions
+            quiz_questions = generate_quiz_from_chunks(chunks, request.num_questions)
         
         if not quiz_questions:
             raise HTTPException(status_code=500, detail="Failed to generate quiz questions")
@@ -69,6 +81,36 @@ async def generate_quiz(request: QuizRequest):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Quiz generation error: {e}")
+        logger.error(f"Quiz generation error: {e}")
         raise HTTPException(status_code=500, detail=f"Quiz generation failed: {str(e)}")
 
+
+@router.post("/quiz/batch", response_model=BatchQuizResponse)
+async def generate_quiz_batch(request: BatchQuizRequest):
+    """Generate one combined quiz across many files.
+
+    With `stream=true` the response is NDJSON: one event per partial result
+    as it completes, followed by a final `done` event with per-file status.
+    """
+    if not request.files:
+        raise HTTPException(status_code=400, detail="No files provided")
+
+    user = get_user_from_token()
+    logger.info(f"Batch quiz request: {len(request.files)} files for user {user.uid}")
+    events = run_quiz_batch(request.files, user.uid)
+
+    if request.stream:
+        return StreamingResponse(ndjson(events), media_type="application/x-ndjson")
+
+    questions = []
+    files = []
+    async for event in events:
+        if event["event"] == "file":
+            questions.extend(MCQ(**q) for q in event["questions"])
+        elif event["event"] == "done":
+            files = [BatchFileResult(**f) for f in event["files"]]
+
+    if not questions:
+        raise HTTPException(status_code=500, detail="Failed to generate quiz questions")
+
+    return BatchQuizResponse(num_questions=len(questions), files=files, questions=questions)
@@ -0,0 +1,48 @@
+import asyncio
+import logging
+import os
+
+from fastapi import APIRouter, HTTPException
+
+from db import get_db, get_user_from_token
+from models import SearchRequest, SearchResponse, SearchHit
+from rag import has_index, index_document, search_documents
+
+logger = logging.getLogger(__name__)
+
+
+router = APIRouter()
+
+
+@router.post("/search", response_model=SearchResponse)
+async def search(payload: SearchRequest):
+	"""Hybrid BM25 + dense search across the user's indexed documents"""
+	if not payload.query.strip():
+		raise HTTPException(status_code=400, detail="Query is empty")
+
+	user = get_user_from_token()
+	try:
+		docs = get_db().collection("files").where("user_id", "==", user.uid).stream()
+		metas = {doc.id: doc.to_dict() or {} for doc in docs}
+		filenames = {file_id: meta.get("filename", "") for file_id, meta in metas.items()}
+		wanted = [f for f in payload.file_ids if f in filenames] if payload.file_ids else list(filenames)
+		file_ids = []
+		for file_id in wanted:
+			if not has_index(file_id):
+				# Never indexed yet, or evicted by the storage sweeper: rebuild like /chat does
+				filepath = metas[file_id].get("filepath")
+				if not filepath or not os.path.exists(filepath):
+					continue
+				if await asyncio.to_thread(index_document, file_id, filepath) is None:
+					continue
+			file_ids.append(file_id)
+
+		results = await asyncio.to_thread(search_documents, file_ids, payload.query, payload.k)
+	except Exception as e:
+		logger.error(f"Search error: {e}")
+		raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
+
+	return SearchResponse(
+		hits=[SearchHit(file_id=f, filename=filenames[f], text=text, distance=distance) for f, text, distance in results],
+		searched_files=len(file_ids),
+	)
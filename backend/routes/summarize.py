@@ -1,8 +1,11 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 
-from db import get_db
-from models import SummarizeRequest, SummarizeResponse
+from db import get_db, get_user_from_token
+from models import SummarizeRequest, SummarizeResponse, BatchSummarizeRequest, BatchSummarizeResponse, BatchFileResult
 from rag import extract_text, chunk_text, summarize_document
+from batch import run_summary_batch, ndjson
+from observability import stage
 
 
 router = APIRouter()
@@ -14,7 +17,8 @@ async def summarize_file(payload: SummarizeRequest):
 	db = get_db()
 	
 	try:
-		file_doc = db.collection("files").document(payload.file_id).get()
+		with stage("metadata_lookup"):
+			file_doc = db.collection("files").document(payload.file_id).get()
 		if not file_doc.exists:
 			raise HTTPException(status_code=404, detail="File not found")
 		
@@ -47,3 +51,34 @@ async def summarize_file(payload: SummarizeRequest):
 		
 	except Exception as e:
 		raise HTTPException(status_code=500, detail=f"Error processing document: {str(e)}")
+
+
+@router.post("/summarize/batch", response_model=BatchSummarizeResponse)
+async def summarize_files(payload: BatchSummarizeRequest):
+	"""Summarize many documents at once, packing short ones into shared LLM calls.
+
+	With `stream=true` each summary is sent as an NDJSON event as soon as it is ready.
+	"""
+	if not payload.file_ids:
+		raise HTTPException(status_code=400, detail="No files provided")
+
+	user = get_user_from_token()
+	events = run_summary_batch(payload.file_ids, user.uid, payload.max_length)
+
+	if payload.stream:
+		return StreamingResponse(ndjson(events), media_type="application/x-ndjson")
+
+	summaries = []
+	files = []
+	async for event in events:
+		if event["event"] == "file":
+			summaries.append(SummarizeResponse(
+				file_id=event["file_id"],
+				summary=event["summary"],
+				key_points=event["key_points"],
+				word_count=event["word_count"]
+			))
+		elif event["event"] == "done":
+			files = [BatchFileResult(**f) for f in event["files"]]
+
+	return BatchSummarizeResponse(files=files, summaries=summaries)
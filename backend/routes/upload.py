@@ -1,19 +1,30 @@
+import asyncio
+import logging
 import os
 import shutil
 from datetime import datetime, timezone
 from fastapi import APIRouter, File, UploadFile, HTTPException, Depends, Body
 from fastapi import Query
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 import uuid
 from firebase_admin import firestore
 
 from db import get_db
+from archive import ingest_archive
+from batch import ndjson
+from ingest import finish_reindex, reindex_document
 from models import FileMeta
+from pool import schedule_fill, delete_pool
+from rag import delete_index
+from storage import record_write, usage_for_user
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 ALLOWED_EXTS = {"pdf", "docx", "pptx"}
 MAX_MB = 25
+ARCHIVE_MAX_MB = int(os.getenv("ARCHIVE_MAX_MB", "1024"))
 
 
 def get_upload_dir() -> str:
@@ -23,6 +34,34 @@ def get_upload_dir() -> str:
 	return upload_dir
 
 
+def _file_ext(file: UploadFile) -> str:
+	if not file.filename:
+		raise HTTPException(status_code=400, detail="No file provided")
+	file_ext = (file.filename.split(".")[-1] or "").lower()
+	if file_ext not in ALLOWED_EXTS:
+		raise HTTPException(status_code=400, detail=f"Unsupported file type: {file_ext}. Supported types are: {', '.join(ALLOWED_EXTS)}")
+	return file_ext
+
+
+async def _save_to_temp(file: UploadFile, file_ext: str, max_mb: int = MAX_MB) -> str:
+	"""Stream an upload to a temp file in the upload dir, enforcing `max_mb`"""
+	tmp_path = os.path.join(get_upload_dir(), f"tmp_{uuid.uuid4()}.{file_ext}")
+	bytes_written = 0
+
+	with open(tmp_path, "wb") as out:
+		while True:
+			chunk = await file.read(1024 * 1024)
+			if not chunk:
+				break
+			bytes_written += len(chunk)
+			if bytes_written > max_mb * 1024 * 1024:
+				out.close()
+				os.remove(tmp_path)
+				raise HTTPException(status_code=400, detail=f"File exceeds {max_mb}MB limit")
+			out.write(chunk)
+	return tmp_path
+
+
 # Delete file endpoint
 @router.delete("/delete-file")
 async def delete_file(
@@ -44,39 +83,21 @@ async def delete_file(
 		# Find the file doc for this user and filename
 		docs = db.collection("files").where("user_id", "==", user_id).where("filename", "==", filename).stream()
 		for doc in docs:
+			delete_pool(doc.id)
+			delete_index(doc.id)
 			doc.reference.delete()
 
 		return {"detail": "File deleted"}
 	except Exception as e:
-		print(f"Delete file error: {str(e)}")
+		logger.error(f"Delete file error: {str(e)}")
 		raise HTTPException(status_code=500, detail=f"Failed to delete file: {str(e)}")
 
 
 @router.post("/upload")
 async def upload_file(user_id: str = Query(...), file: UploadFile = File(...)):
 	try:
-		if not file.filename:
-			raise HTTPException(status_code=400, detail="No file provided")
-		
-		file_ext = (file.filename.split(".")[-1] or "").lower()
-		if file_ext not in ALLOWED_EXTS:
-			raise HTTPException(status_code=400, detail=f"Unsupported file type: {file_ext}. Supported types are: {', '.join(ALLOWED_EXTS)}")
-
-		# Validate size (stream to temp)
-		tmp_path = os.path.join(get_upload_dir(), f"tmp_{uuid.uuid4()}.{file_ext}")
-		bytes_written = 0
-		
-		with open(tmp_path, "wb") as out:
-			while True:
-				chunk = await file.read(1024 * 1024)
-				if not chunk:
-					break
-				bytes_written += len(chunk)
-				if bytes_written > MAX_MB * 1024 * 1024:
-					out.close()
-					os.remove(tmp_path)
-					raise HTTPException(status_code=400, detail=f"File exceeds {MAX_MB}MB limit")
-				out.write(chunk)
+		file_ext = _file_ext(file)
+		tmp_path = await _save_to_temp(file, file_ext)
 
 		final_path = os.path.join(get_upload_dir(), file.filename)
 		# If filename exists, append UUID
@@ -85,6 +106,7 @@ async def upload_file(user_id: str = Query(...), file: UploadFile = File(...)):
 			final_path = os.path.join(get_upload_dir(), f"{stem}_{uuid.uuid4()}{ext}")
 
 		shutil.move(tmp_path, final_path)
+		record_write(os.path.getsize(final_path))
 
 		# Save metadata to Firebase
 		db = get_db()
@@ -106,7 +128,11 @@ async def upload_file(user_id: str = Query(...), file: UploadFile = File(...)):
 		doc_ref = db.collection("files").document(file_id)
 		doc_ref.set(meta_dict)
 		
-		print(f"File uploaded successfully: {file_id} -> {final_path}")
+		logger.info(f"File uploaded successfully: {file_id} -> {final_path}")
+
+		# Pre-generate the question pool so quizzes on this file are served by sampling
+		if os.getenv("QUESTION_POOL_PREBUILD", "1") != "0":
+			schedule_fill(file_id, final_path)
 		
 		return JSONResponse({
 			"file_id": file_id,
@@ -118,17 +144,105 @@ async def upload_file(user_id: str = Query(...), file: UploadFile = File(...)):
 		})
 		
 	except Exception as e:
-		print(f"Upload error: {str(e)}")
+		logger.error(f"Upload error: {str(e)}")
 		raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 
+@router.post("/upload/archive")
+async def upload_archive(user_id: str = Query(...), file: UploadFile = File(...)):
+	"""Ingest every PDF/DOCX/PPTX in a ZIP, streaming NDJSON progress per file"""
+	if not file.filename or not file.filename.lower().endswith(".zip"):
+		raise HTTPException(status_code=400, detail="Expected a .zip archive")
+	archive_path = await _save_to_temp(file, "zip", ARCHIVE_MAX_MB)
+
+	async def _events():
+		events = ingest_archive(archive_path, file.filename, user_id, ALLOWED_EXTS, MAX_MB * 1024 * 1024, get_upload_dir())
+		try:
+			async for event in events:
+				yield event
+		finally:
+			# Close the ingest first: its workers may still be reading the archive
+			await events.aclose()
+			if os.path.exists(archive_path):
+				os.remove(archive_path)
+
+	return StreamingResponse(ndjson(_events()), media_type="application/x-ndjson")
+
+
+@router.put("/files/{file_id}")
+async def replace_file(file_id: str, user_id: str = Query(...), file: UploadFile = File(...)):
+	"""Upload a new version of an existing file, re-indexing only what changed"""
+	try:
+		db = get_db()
+		doc_ref = db.collection("files").document(file_id)
+		doc = doc_ref.get()
+		if not doc.exists or doc.to_dict().get("user_id") != user_id:
+			raise HTTPException(status_code=404, detail="File not found")
+		old = doc.to_dict()
+
+		file_ext = _file_ext(file)
+		tmp_path = await _save_to_temp(file, file_ext)
+
+		# Index the new version before touching the stored one, so a failure leaves it intact
+		try:
+			reindex = await asyncio.to_thread(reindex_document, file_id, tmp_path)
+		except Exception as e:
+			if os.path.exists(tmp_path):
+				os.remove(tmp_path)
+			if isinstance(e, ValueError):
+				raise HTTPException(status_code=400, detail=str(e))
+			raise
+
+		# Keep the stored name when the extension is unchanged so links stay valid
+		old_path = old.get("filepath", "")
+		if old_path and old_path.lower().endswith(f".{file_ext}"):
+			final_path = old_path
+		else:
+			stem = os.path.splitext(os.path.basename(old_path) or file.filename)[0]
+			final_path = os.path.join(get_upload_dir(), f"{stem}.{file_ext}")
+			if os.path.exists(final_path):
+				final_path = os.path.join(get_upload_dir(), f"{stem}_{uuid.uuid4()}.{file_ext}")
+		shutil.move(tmp_path, final_path)
+		record_write(os.path.getsize(final_path))
+		if old_path and old_path != final_path and os.path.exists(old_path):
+			os.remove(old_path)
+		stats = await asyncio.to_thread(finish_reindex, file_id, final_path, reindex)
+
+		update = {
+			"filename": os.path.basename(final_path),
+			"filepath": final_path,
+			"filetype": file_ext,
+			"upload_date": datetime.now(timezone.utc),
+			"version": old.get("version", 1) + 1,
+		}
+		doc_ref.update(update)
+		logger.info(f"File replaced: {file_id} -> {final_path} (version {update['version']})")
+
+		return JSONResponse({
+			"file_id": file_id,
+			"user_id": user_id,
+			"filename": update["filename"],
+			"filepath": final_path,
+			"filetype": file_ext,
+			"upload_date": update["upload_date"].isoformat(),
+			"version": update["version"],
+			"reindex": stats,
+		})
+
+	except HTTPException:
+		raise
+	except Exception as e:
+		logger.error(f"Replace file error: {str(e)}")
+		raise HTTPException(status_code=500, detail=f"Replace failed: {str(e)}")
+
+
 @router.get("/files")
 async def list_files(user_id: str = Query(...)):
 	try:
 		db = get_db()
 		items = []
 		
-		print(f"Listing files for user: {user_id}")
+		logger.info(f"Listing files for user: {user_id}")
 		
 		# Query Firestore for user's files
 		docs = db.collection("files").where("user_id", "==", user_id).order_by("upload_date", direction=firestore.Query.DESCENDING).stream()
@@ -137,12 +251,21 @@ async def list_files(user_id: str = Query(...)):
 			doc_data = doc.to_dict()
 			doc_data["file_id"] = doc.id
 			items.append(doc_data)
-			print(f"Found file: {doc_data.get('filename', 'Unknown')}")
+			logger.info(f"Found file: {doc_data.get('filename', 'Unknown')}")
 		
-		print(f"Total files found: {len(items)}")
+		logger.info(f"Total files found: {len(items)}")
 		return items
 		
 	except Exception as e:
-		print(f"List files error: {str(e)}")
+		logger.error(f"List files error: {str(e)}")
 		# Return empty array instead of raising exception for better UX
-		return []
\ No newline at end of file
+		return []
+
+@router.get("/storage/usage")
+async def storage_usage(user_id: str = Query(...)):
+	"""Disk used by a user's uploads and the indexes/pools derived from them"""
+	try:
+		return await asyncio.to_thread(usage_for_user, user_id)
+	except Exception as e:
+		logger.error(f"Storage usage error: {str(e)}")
+		raise HTTPException(status_code=500, detail=f"Failed to compute storage usage: {str(e)}")
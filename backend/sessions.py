@@ -0,0 +1,139 @@
+"""Multi-turn document chat sessions.
+
+Each session keeps the Ollama `context` returned by the previous turn. Sending
+it back with the next prompt lets Ollama continue from the evaluated
+conversation instead of re-reading the instructions, earlier chunks and
+earlier answers, so a follow-up question only pays for its new retrieved
+chunks plus answer generation. Chunks already shown to the model in this
+session are not re-sent.
+
+Sessions live in process memory, expire after `CHAT_SESSION_TTL` seconds of
+inactivity and restart their Ollama context once it grows past
+`CHAT_MAX_CONTEXT_TOKENS`.
+"""
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from rag import retrieve_context, _ollama_generate, _ollama_cli
+
+
+CHAT_SESSION_TTL = int(os.getenv("CHAT_SESSION_TTL", "1800"))
+CHAT_MAX_SESSIONS = int(os.getenv("CHAT_MAX_SESSIONS", "500"))
+CHAT_MAX_CONTEXT_TOKENS = int(os.getenv("CHAT_MAX_CONTEXT_TOKENS", "6000"))
+CHAT_HISTORY_TURNS = 4
+
+
+@dataclass
+class ChatSession:
+	session_id: str
+	file_id: str
+	user_id: str
+	filename: str = ""
+	context: List[int] = field(default_factory=list)
+	sent_chunks: Set[str] = field(default_factory=set)
+	history: List[Tuple[str, str]] = field(default_factory=list)
+	last_used: float = field(default_factory=time.time)
+	lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+_sessions: Dict[str, ChatSession] = {}
+_sessions_guard = threading.Lock()
+
+
+def _expire_sessions(now: float) -> None:
+	expired = [sid for sid, s in _sessions.items() if now - s.last_used > CHAT_SESSION_TTL]
+	for sid in expired:
+		del _sessions[sid]
+	while len(_sessions) >= CHAT_MAX_SESSIONS:
+		oldest = min(_sessions.values(), key=lambda s: s.last_used)
+		del _sessions[oldest.session_id]
+
+
+def get_or_create_session(session_id: Optional[str], file_id: str, user_id: str, filename: str = "") -> ChatSession:
+	"""Return the caller's session for this file, starting a new one if it is unknown or expired"""
+	now = time.time()
+	with _sessions_guard:
+		session = _sessions.get(session_id) if session_id else None
+		if session and session.file_id == file_id and session.user_id == user_id:
+			session.last_used = now
+			return session
+		_expire_sessions(now)
+		session = ChatSession(session_id=str(uuid.uuid4()), file_id=file_id, user_id=user_id, filename=filename)
+		_sessions[session.session_id] = session
+		return session
+
+
+def end_session(session_id: str, user_id: str) -> bool:
+	with _sessions_guard:
+		session = _sessions.get(session_id)
+		if session and session.user_id == user_id:
+			del _sessions[session_id]
+			return True
+	return False
+
+
+def _opening_prompt(filename: str) -> str:
+	return f"""You are a helpful study assistant answering questions about the document "{filename}".
+Answer using only the document excerpts provided during this conversation.
+If the excerpts do not contain the answer, say so briefly instead of guessing.
+Keep answers concise and cite the relevant part of the excerpts when useful.
+
+"""
+
+
+def _turn_prompt(message: str, new_chunks: List[str], first_turn: bool, filename: str) -> str:
+	parts = [_opening_prompt(filename)] if first_turn else []
+	if new_chunks:
+		excerpts = "\n\n".join(f"[Excerpt]\n{c}" for c in new_chunks)
+		parts.append(f"New document excerpts:\n{excerpts}\n\n")
+	parts.append(f"Question: {message}\nAnswer:")
+	return "".join(parts)
+
+
+def _stateless_prompt(session: ChatSession, message: str, chunks: List[str]) -> str:
+	"""Full prompt for the CLI fallback, which cannot reuse an Ollama context"""
+	history = "".join(f"Question: {q}\nAnswer: {a}\n\n" for q, a in session.history[-CHAT_HISTORY_TURNS:])
+	excerpts = "\n\n".join(f"[Excerpt]\n{c}" for c in chunks)
+	return f"{_opening_prompt(session.filename)}Document excerpts:\n{excerpts}\n\n{history}Question: {message}\nAnswer:"
+
+
+def chat_turn(session: ChatSession, message: str, k: int = 6) -> dict:
+	"""Answer one message: retrieve top-k chunks, then continue the session's Ollama context"""
+	with session.lock:
+		retrieved = retrieve_context(session.file_id, message, k=k)
+		chunks = [text for text, _ in retrieved]
+
+		if session.context and len(session.context) > CHAT_MAX_CONTEXT_TOKENS:
+			# Start over rather than let Ollama silently truncate the window
+			session.context = []
+			session.sent_chunks = set()
+
+		first_turn = not session.context
+		new_chunks = [c for c in chunks if c not in session.sent_chunks]
+		prompt = _turn_prompt(message, new_chunks, first_turn, session.filename)
+
+		data = _ollama_generate(prompt, context=session.context or None)
+		if data is not None:
+			answer = data.get("response", "").strip()
+			session.context = data.get("context") or []
+			session.sent_chunks.update(new_chunks)
+		else:
+			# HTTP just failed; retrying it would double the worst-case latency
+			answer = _ollama_cli(_stateless_prompt(session, message, chunks)).strip()
+			session.context = []
+			session.sent_chunks = set()
+
+		session.history.append((message, answer))
+		session.history = session.history[-CHAT_HISTORY_TURNS:]
+		session.last_used = time.time()
+
+		return {
+			"answer": answer,
+			"sources": [{"text": text, "distance": distance} for text, distance in retrieved],
+			"context_tokens": len(session.context),
+			"prompt_eval_count": (data or {}).get("prompt_eval_count"),
+		}
@@ -0,0 +1,365 @@
+"""Disk usage tracking, orphan sweeping and budget enforcement for UPLOAD_DIR.
+
+Everything the backend writes lives under UPLOAD_DIR:
+
+	<filename>                  original upload (referenced by a Firestore `files` doc)
+	tmp_<uuid>.<ext>            upload in progress, or left behind by an aborted one
+	.index/<file_id>.{json,npy} chunk index (regenerable: re-embedded on demand)
+	.pools/<file_id>.json       question pool (regenerable: refilled on demand)
+
+Artifacts are grouped per file_id and carry their size and last-access
+time. Reads go through `touch()`, which is kept in memory and flushed to
+`.storage/access.json` on each sweep; filesystem atimes are not trusted
+because most mounts use relatime/noatime.
+
+A background sweeper started by the app runs every STORAGE_SWEEP_INTERVAL
+seconds, or sooner once uploads push the estimated total over the budget. It:
+
+- removes `tmp_*` files, originals no Firestore doc points at, and indexes or
+  pools of deleted files, once they are older than STORAGE_ORPHAN_GRACE;
+- if STORAGE_BUDGET_MB is set and exceeded, evicts least recently used
+  regenerable artifacts. Originals are user data and are only evicted (least
+  recently used first, together with their metadata) when
+  STORAGE_EVICT_ORIGINALS=1.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+SWEEP_INTERVAL = float(os.getenv("STORAGE_SWEEP_INTERVAL", "600"))
+ORPHAN_GRACE = float(os.getenv("STORAGE_ORPHAN_GRACE", "3600"))
+
+REGENERABLE_KINDS = ("index", "pool")
+
+_access: Dict[str, float] = {}
+_access_lock = threading.Lock()
+_sweep_lock = threading.Lock()
+_written_since_scan = 0
+_last_total = 0
+_wakeup: Optional[asyncio.Event] = None
+
+
+@dataclass
+class Artifact:
+	"""One unit of storage; an index is its .json and .npy together"""
+	kind: str  # "original", "tmp", "index" or "pool"
+	paths: List[str]
+	size: int
+	last_access: float
+	file_id: Optional[str] = None
+	user_id: Optional[str] = None
+	orphan: bool = False
+
+	@property
+	def regenerable(self) -> bool:
+		return self.kind in REGENERABLE_KINDS
+
+
+@dataclass
+class Scan:
+	artifacts: List[Artifact] = field(default_factory=list)
+
+	@property
+	def total(self) -> int:
+		return sum(a.size for a in self.artifacts)
+
+
+def budget_bytes() -> int:
+	return int(float(os.getenv("STORAGE_BUDGET_MB", "0")) * 1024 * 1024)
+
+
+def _upload_dir() -> str:
+	return os.getenv("UPLOAD_DIR", "uploads")
+
+
+def _key(path: str) -> str:
+	return os.path.relpath(os.path.abspath(path), os.path.abspath(_upload_dir()))
+
+
+def touch(path: str) -> None:
+	"""Record that `path` (anywhere under UPLOAD_DIR) was just read"""
+	with _access_lock:
+		_access[_key(path)] = time.time()
+
+
+def record_write(num_bytes: int) -> None:
+	"""Account for bytes just written; wakes the sweeper early once over budget"""
+	global _written_since_scan
+	_written_since_scan += num_bytes
+	budget = budget_bytes()
+	if budget and _last_total + _written_since_scan > budget and _wakeup is not None:
+		_wakeup.set()
+
+
+def _manifest_path() -> str:
+	return os.path.join(_upload_dir(), ".storage", "access.json")
+
+
+def _read_manifest() -> Dict[str, float]:
+	try:
+		with open(_manifest_path(), "r", encoding="utf-8") as f:
+			return json.load(f)
+	except (OSError, json.JSONDecodeError):
+		return {}
+
+
+def _merged_access(stored: Dict[str, float]) -> Dict[str, float]:
+	with _access_lock:
+		for key, ts in _access.items():
+			stored[key] = max(ts, stored.get(key, 0.0))
+	return stored
+
+
+def _flush_access() -> Dict[str, float]:
+	"""Merge in-memory access times into the manifest (other workers write it too)"""
+	path = _manifest_path()
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	stored = _merged_access(_read_manifest())
+	with _access_lock:
+		_access.clear()
+	upload_dir = _upload_dir()
+	stored = {key: ts for key, ts in stored.items() if os.path.exists(os.path.join(upload_dir, key))}
+	tmp = f"{path}.{os.getpid()}.tmp"
+	with open(tmp, "w", encoding="utf-8") as f:
+		json.dump(stored, f)
+	os.replace(tmp, path)
+	return stored
+
+
+def _load_owners() -> Optional[Dict[str, dict]]:
+	"""file_id -> {"user_id", "filepath"} for every file doc, or None if the store is unreachable"""
+	from db import get_db
+
+	try:
+		return {
+			doc.id: {"user_id": data.get("user_id"), "filepath": data.get("filepath")}
+			for doc in get_db().collection("files").stream()
+			for data in (doc.to_dict() or {},)
+		}
+	except Exception as e:
+		logger.warning(f"Storage scan could not read file metadata: {e}")
+		return None
+
+
+def _metadata_is_persistent() -> bool:
+	"""The in-memory demo store starts empty on every boot, so it cannot vouch that an upload or index is unreferenced"""
+	from db import get_db, MockFirestore
+
+	return not isinstance(get_db(), MockFirestore)
+
+
+def scan(owners: Optional[Dict[str, dict]] = None, access: Optional[Dict[str, float]] = None) -> Scan:
+	"""Inventory UPLOAD_DIR. Without `owners`, nothing is flagged as an orphan."""
+	upload_dir = _upload_dir()
+	access = access if access is not None else {}
+	# Without a persistent metadata store, only tmp files can be told to be orphans
+	known = owners is not None and _metadata_is_persistent()
+	owners = owners or {}
+	by_path = {os.path.abspath(o["filepath"]): (file_id, o["user_id"]) for file_id, o in owners.items() if o.get("filepath")}
+	now = time.time()
+	result = Scan()
+
+	def _stat(paths: List[str]) -> tuple:
+		size, mtime = 0, 0.0
+		for p in paths:
+			st = os.stat(p)
+			size += st.st_size
+			mtime = max(mtime, st.st_mtime)
+		return size, max(mtime, max(access.get(_key(p), 0.0) for p in paths))
+
+	def _add(kind: str, paths: List[str], file_id: Optional[str], orphan: bool) -> None:
+		try:
+			size, last_access = _stat(paths)
+		except FileNotFoundError:
+			return  # removed while scanning
+		user_id = owners.get(file_id, {}).get("user_id") if file_id else None
+		result.artifacts.append(Artifact(kind, paths, size, last_access, file_id, user_id, orphan and now - last_access > ORPHAN_GRACE))
+
+	with os.scandir(upload_dir) as entries:
+		for entry in entries:
+			if not entry.is_file() or entry.name.startswith("."):
+				continue
+			if entry.name.startswith("tmp_"):
+				_add("tmp", [entry.path], None, True)
+				continue
+			file_id, _ = by_path.get(os.path.abspath(entry.path), (None, None))
+			_add("original", [entry.path], file_id, known and file_id is None)
+
+	for kind, subdir in (("index", ".index"), ("pool", ".pools")):
+		directory = os.path.join(upload_dir, subdir)
+		if not os.path.isdir(directory):
+			continue
+		groups: Dict[str, List[str]] = {}
+		with os.scandir(directory) as entries:
+			for entry in entries:
+				if entry.is_file() and ".tmp" not in entry.name:
+					groups.setdefault(entry.name.split(".", 1)[0], []).append(entry.path)
+		for file_id, paths in groups.items():
+			_add(kind, sorted(paths), file_id, known and file_id not in owners)
+	return result
+
+
+def _remove(artifact: Artifact) -> int:
+	from pool import delete_pool
+	from rag import delete_index
+
+	if artifact.kind == "index":
+		delete_index(artifact.file_id)
+	elif artifact.kind == "pool":
+		delete_pool(artifact.file_id)
+	else:
+		for path in artifact.paths:
+			try:
+				os.remove(path)
+			except FileNotFoundError:
+				pass
+	return artifact.size
+
+
+def remove_derived(file_id: str) -> None:
+	"""Delete the index and pool of `file_id`, including temp files left by an interrupted write"""
+	from pool import delete_pool
+	from rag import delete_index
+
+	delete_index(file_id)
+	delete_pool(file_id)
+	for subdir in (".index", ".pools"):
+		directory = os.path.join(_upload_dir(), subdir)
+		if not os.path.isdir(directory):
+			continue
+		with os.scandir(directory) as entries:
+			for entry in entries:
+				if entry.name.startswith(f"{file_id}."):
+					try:
+						os.remove(entry.path)
+					except FileNotFoundError:
+						pass
+
+
+def _evict_original(artifact: Artifact, scanned: Scan) -> int:
+	"""Drop an original upload along with its metadata and derived artifacts"""
+	from db import get_db
+
+	freed = _remove(artifact)
+	for other in scanned.artifacts:
+		if other.file_id == artifact.file_id and other.regenerable and other.size:
+			freed += _remove(other)
+			other.size = 0
+	if artifact.file_id:
+		get_db().collection("files").document(artifact.file_id).delete()
+	return freed
+
+
+def sweep() -> dict:
+	"""Remove orphans, then evict down to the budget. Returns what was done."""
+	global _last_total, _written_since_scan
+	if not _sweep_lock.acquire(blocking=False):
+		return {"skipped": True}
+	try:
+		started = time.perf_counter()
+		access = _flush_access()
+		owners = _load_owners()
+		_written_since_scan = 0
+		scanned = scan(owners, access)
+		report = {"orphans_removed": 0, "orphan_bytes": 0, "evicted": 0, "evicted_bytes": 0, "evicted_originals": 0}
+
+		for artifact in scanned.artifacts:
+			if artifact.orphan:
+				report["orphan_bytes"] += _remove(artifact)
+				report["orphans_removed"] += 1
+				artifact.size = 0
+
+		budget = budget_bytes()
+		total = scanned.total
+		if budget and total > budget and owners is not None:
+			# A document counts as used when any of its artifacts was (e.g. /chat only reads the index)
+			recency: Dict[str, float] = {}
+			for a in scanned.artifacts:
+				if a.file_id:
+					recency[a.file_id] = max(recency.get(a.file_id, 0.0), a.last_access)
+			candidates = sorted(
+				(a for a in scanned.artifacts if a.size and a.kind in (*REGENERABLE_KINDS, "original")),
+				# Regenerable artifacts first, least recently used first within each group
+				key=lambda a: (not a.regenerable, a.last_access if a.regenerable else recency.get(a.file_id, a.last_access)),
+			)
+			evict_originals = os.getenv("STORAGE_EVICT_ORIGINALS", "0") == "1"
+			for artifact in candidates:
+				if total <= budget:
+					break
+				if not artifact.size:
+					continue  # already removed alongside its original
+				if artifact.kind == "original":
+					if not evict_originals or artifact.file_id is None:
+						continue
+					freed = _evict_original(artifact, scanned)
+					report["evicted_originals"] += 1
+				else:
+					freed = _remove(artifact)
+				artifact.size = 0
+				total -= freed
+				report["evicted"] += 1
+				report["evicted_bytes"] += freed
+			if total > budget:
+				logger.warning(f"Storage still over budget after eviction: {total} > {budget} bytes")
+
+		_last_total = total
+		report.update(total_bytes=total, budget_bytes=budget, duration_ms=(time.perf_counter() - started) * 1000)
+		if report["orphans_removed"] or report["evicted"]:
+			logger.info(f"Storage sweep: {report}")
+		return report
+	finally:
+		_sweep_lock.release()
+
+
+def usage_for_user(user_id: str) -> dict:
+	"""Bytes used by one user's originals and derived artifacts, per file"""
+	owners = _load_owners() or {}
+	mine = {file_id: o for file_id, o in owners.items() if o.get("user_id") == user_id}
+	files: Dict[str, dict] = {}
+	for artifact in scan(owners, _merged_access(_read_manifest())).artifacts:
+		if artifact.file_id not in mine:
+			continue
+		entry = files.setdefault(artifact.file_id, {
+			"file_id": artifact.file_id,
+			"filename": os.path.basename(mine[artifact.file_id].get("filepath") or ""),
+			"original_bytes": 0,
+			"derived_bytes": 0,
+			"last_access": 0.0,
+		})
+		entry["original_bytes" if artifact.kind == "original" else "derived_bytes"] += artifact.size
+		entry["last_access"] = max(entry["last_access"], artifact.last_access)
+	items = sorted(files.values(), key=lambda f: f["original_bytes"] + f["derived_bytes"], reverse=True)
+	original = sum(f["original_bytes"] for f in items)
+	derived = sum(f["derived_bytes"] for f in items)
+	return {
+		"user_id": user_id,
+		"files": len(items),
+		"original_bytes": original,
+		"derived_bytes": derived,
+		"total_bytes": original + derived,
+		"items": items,
+	}
+
+
+async def run_sweeper() -> None:
+	"""Sweep at startup, then every SWEEP_INTERVAL seconds or early when uploads exceed the budget"""
+	global _wakeup
+	_wakeup = asyncio.Event()
+	while True:
+		_wakeup.clear()
+		try:
+			await asyncio.to_thread(sweep)
+		except Exception as e:
+			logger.error(f"Storage sweep failed: {e}")
+		try:
+			await asyncio.wait_for(_wakeup.wait(), SWEEP_INTERVAL)
+		except asyncio.TimeoutError:
+			pass